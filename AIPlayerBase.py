@@ -1,11 +1,194 @@
+import multiprocessing
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
-import pygame
 
-from Game import Game
-from Piece import Piece
+from Engine import Engine
+from Piece import Piece, formats
 from Player import Player
 
 
+class SearchTimeout(Exception):
+    """
+    Raised inside a search when its deadline has passed or its plan was cancelled.
+    """
+
+
+class Reachability:
+    """
+    The states a piece can reach from where it starts, found by a single
+    breadth-first search over one board.
+
+    Attributes:
+        key (tuple): The board and piece state (shape, x, y, rotation) the search started from.
+        placements (list): The resting placements (x, y, rotation), ordered by x, then y, then rotation.
+        parents (dict): Maps each state the game commands can steer the piece to onto the
+            state it is reached from in the fewest commands. The start maps to None.
+    """
+
+    def __init__(self, key, placements, parents):
+        """
+        Initializes a Reachability result.
+
+        Args:
+            key (tuple): The board and piece state the search started from.
+            placements (list): The resting placements.
+            parents (dict): The back-pointers of the shortest command paths.
+        """
+        self.key = key
+        self.placements = placements
+        self.parents = parents
+
+    def path_map(self, position):
+        """
+        Backtraces the shortest command path to a placement.
+
+        Args:
+            position (tuple): The target state (x, y, rotation).
+
+        Returns:
+            dict: Maps every state along the path to the command to issue
+                there, or None if the commands cannot steer the piece to the target.
+        """
+        if position not in self.parents:
+            return None
+        path_map = {}
+        state = position
+        parent = self.parents[state]
+        while parent is not None:
+            if state[0] > parent[0]:
+                path_map[parent] = 'right'
+            elif state[0] < parent[0]:
+                path_map[parent] = 'left'
+            elif state[1] > parent[1]:
+                path_map[parent] = 'drop'
+            else:
+                path_map[parent] = 'rotate'
+            state = parent
+            parent = self.parents[state]
+        return path_map
+
+
+# the searcher of a pool worker, created once per process by init_worker
+_worker_player = None
+
+
+def init_worker(player_class, kwargs, cancel):
+    """
+    Creates the headless game and searcher a pool worker keeps between decisions.
+
+    Args:
+        player_class (type): The AIPlayerBase subclass of the searcher.
+        kwargs (dict): The keyword arguments of the searcher besides its name and game.
+        cancel (multiprocessing.Event): Set to stop the running tasks, see
+            `AIPlayerBase.run_in_pool`. It becomes the searcher's `cancel_planning`.
+    """
+    global _worker_player
+    _worker_player = player_class('worker', Engine(0), **kwargs)
+    _worker_player.cancel_planning = cancel
+
+
+def get_worker_player():
+    """
+    Returns the searcher of the current pool worker, see `AIPlayerBase.get_pool`.
+
+    Returns:
+        AIPlayerBase: The searcher.
+    """
+    return _worker_player
+
+
+# the methods timed and counted while profiling, see `AIPlayerBase.enable_profiling`:
+# name -> (timed phase or None, counter, amount counted per call from the result or None for 1)
+profiled_methods = {
+    'get_position_validity': ('validity', 'validity_builds', None),
+    'search_reachability': ('reachability', 'reachability_searches', None),
+    'get_possible_states': (None, 'states_enumerated', len),
+    'evaluate_state': ('evaluation', 'evaluations', None),
+    'evaluate_batch': ('evaluation', 'evaluations', len),
+    'place_current_piece': ('path_planning', 'paths_planned', None),
+}
+
+
+class Profile:
+    """
+    The timers and counters collected while a player profiles its decisions.
+
+    The timers are inclusive: the 'reachability' phase contains the validity
+    build it starts with, and 'decision' contains everything `choose_move` does.
+    Searches run in worker processes are not seen.
+
+    Attributes:
+        times (Counter): The seconds spent in every phase.
+        calls (Counter): The number of times every phase ran.
+        counters (Counter): The number of validity builds, reachability searches,
+            states enumerated, evaluations, paths planned, decisions, nodes
+            searched and Engine push and pop calls.
+        log_interval (float): The seconds between two log lines, or None for no log.
+        last_log (float): The `time.perf_counter` value of the last log line.
+    """
+
+    def __init__(self, log_interval=None):
+        """
+        Initializes an empty profile.
+
+        Args:
+            log_interval (float): The seconds between two log lines printed after a
+                decision, or None to print none.
+        """
+        self.times = Counter()
+        self.calls = Counter()
+        self.counters = Counter()
+        self.log_interval = log_interval
+        self.last_log = time.perf_counter()
+
+    def record(self, phase, seconds):
+        """
+        Adds a run of a phase.
+
+        Args:
+            phase (str): The name of the phase.
+            seconds (float): The time the run took.
+        """
+        self.times[phase] += seconds
+        self.calls[phase] += 1
+
+    def stats(self):
+        """
+        Summarizes the profile.
+
+        Returns:
+            dict: Per phase the total and mean time in milliseconds and the number of
+                runs under 'phases', the raw counters under 'counters', and the
+                nodes, evaluations and Engine push calls per decision.
+        """
+        decisions = max(1, self.counters['decisions'])
+        return {
+            'phases': {phase: {'total_ms': self.times[phase] * 1000, 'calls': self.calls[phase],
+                               'mean_ms': self.times[phase] * 1000 / self.calls[phase]}
+                       for phase in self.times},
+            'counters': dict(self.counters),
+            'nodes_per_decision': self.counters['nodes'] / decisions,
+            'evaluations_per_decision': self.counters['evaluations'] / decisions,
+            'pushes_per_decision': self.counters['pushes'] / decisions,
+        }
+
+    def log_line(self):
+        """
+        Formats the profile as one line.
+
+        Returns:
+            str: The time and runs of every phase followed by the counters.
+        """
+        phases = ' '.join(f"{phase}={self.times[phase] * 1000:.1f}ms/{self.calls[phase]}"
+                          for phase in sorted(self.times))
+        counters = ' '.join(f"{name}={count}" for name, count in sorted(self.counters.items()))
+        return f"profile: {phases} | {counters}"
+
+
 class AIPlayerBase(Player):
     """
     Base class for AI players in Tetris.
@@ -20,6 +203,26 @@ class AIPlayerBase(Player):
         command_time (int): Time elapsed since the last command was issued.
         moving_piece (bool): Indicates whether the AI is moving the piece.
         choice (tuple): The chosen position for placing the piece.
+        path_map (dict): Maps the states along the planned path to the command to issue there.
+        reachability (Reachability): The last search over the live game, shared by
+            choosing a move and planning its path.
+        background (bool): Whether `choose_move` runs in a worker thread on a clone of
+            the game, so frames keep being drawn while the AI thinks. The plan is
+            dropped if the piece locks or can no longer reach the move first.
+        planning (Future): The running background plan, or None.
+        planned_piece (Piece): The live piece the running background plan is for.
+        cancel_planning (threading.Event): Set to ask the running background plan to stop.
+        pipeline (bool): Whether to plan the next piece in the background while the
+            current one is being moved, on the board the chosen move is predicted to
+            leave. The plan is used if the board and pieces match when the next piece
+            spawns. Implies background planning.
+        pipelined (tuple): The predicted state key and the plan for the next piece, or None.
+        pipeline_hits (int): The number of pipelined plans that matched the spawned piece.
+        pipeline_misses (int): The number of pipelined plans that were thrown away.
+        profile (Profile): The timers and counters of the player while profiling, or None.
+        pool (multiprocessing.Pool): The worker processes of a parallel search, or None
+            until `get_pool` starts them.
+        pool_cancel (multiprocessing.Event): Set to make the pool workers stop their tasks.
     """
 
     def __init__(self, name, game):
@@ -28,7 +231,7 @@ class AIPlayerBase(Player):
 
         Args:
             name (str): Name of the player.
-            game (Game): The game instance to control.
+            game (Engine): The game instance to control.
         """
         super().__init__(name, game)
         self.placing_piece = False
@@ -37,13 +240,30 @@ class AIPlayerBase(Player):
         self.command_time = 0
         self.moving_piece = False
         self.choice = None
-
-    def evaluate_state(self, game: Game):
+        self.path_map = {}
+        self.reachability = None
+        self.background = False
+        self.executor = None
+        self.planning = None
+        self.planned_piece = None
+        self.cancel_planning = threading.Event()
+        self.pipeline = False
+        self.pipelined = None
+        self.pipeline_hits = 0
+        self.pipeline_misses = 0
+        self.profile = None
+        self.pool = None
+        self.pool_cancel = None
+
+    def evaluate_state(self, game: Engine):
         """
         Evaluates the state of the game and assigns a score based on various factors.
 
+        The column heights and hole counts are read from the features the
+        game keeps up to date, so this costs O(cols).
+
         Args:
-            game (Game): The current game instance.
+            game (Engine): The current game instance.
 
         Returns:
             int: The score representing the desirability of the game state.
@@ -54,21 +274,12 @@ class AIPlayerBase(Player):
         score += game.score * 6
 
         # 2. aggregate height
-        heights = [0] * game.cols
-        for x in range(game.cols):
-            for y in range(game.rows):
-                if not game.accepted_positions[x][y]:
-                    heights[x] = game.rows - y
-                    break
+        heights = game.heights
         aggregate_height = sum(heights)
         score -= aggregate_height * 1
 
         # 3. number of holes
-        holes = 0
-        for x in range(game.cols):
-            for y in range(1,game.rows):
-                if game.accepted_positions[x][y] and not game.accepted_positions[x][y-1]:
-                    holes += 1
+        holes = sum(game.column_holes)
         score -= holes * 25
 
         # 4. bumpiness
@@ -89,6 +300,52 @@ class AIPlayerBase(Player):
 
         return score
     
+    def evaluate_batch(self, boards, scores):
+        """
+        Evaluates many game states at once with the same weights as `evaluate_state`.
+
+        Args:
+            boards (np.ndarray): Either a stacked (N, cols, rows) boolean array that is
+                True for occupied cells, or an (N, rows) integer array of row bitmasks
+                as kept in `Engine.board`.
+            scores (np.ndarray): The N game scores.
+
+        Returns:
+            np.ndarray: The N integer scores representing the desirability of the game states.
+        """
+        boards = np.asarray(boards)
+        if boards.ndim == 2:
+            columns = np.arange(self.game.cols)
+            occupied = (boards[:, None, :] >> columns[None, :, None]) & 1 == 1
+        else:
+            occupied = boards.astype(bool)
+        rows = occupied.shape[2]
+
+        # 1. number of cleared rows
+        score = np.asarray(scores, dtype=np.int64) * 6
+
+        # 2. aggregate height
+        heights = np.where(occupied.any(axis=2), rows - occupied.argmax(axis=2), 0)
+        score -= heights.sum(axis=1)
+
+        # 3. number of holes
+        holes = (~occupied[:, :, 1:] & occupied[:, :, :-1]).sum(axis=(1, 2))
+        score -= holes * 25
+
+        # 4. bumpiness
+        score -= np.abs(np.diff(heights, axis=1)).sum(axis=1) * 2
+
+        # 5. well sums
+        left, middle, right = heights[:, :-2], heights[:, 1:-1], heights[:, 2:]
+        wells = np.where((left > middle) & (right > middle),
+                         np.minimum(left, right) - middle, 0).sum(axis=1)
+        if heights.shape[1] > 1:
+            wells += heights[:, 1] - heights[:, 0]
+            wells += heights[:, -2] - heights[:, -1]
+        score -= wells
+
+        return score
+
     def update(self, update_time):
         """
         Updates the AI player's state and handles piece placement and movement.
@@ -107,9 +364,9 @@ class AIPlayerBase(Player):
             self.command_time += update_time
             if self.command_time > self.command_interval:
                 self.command_time -= self.command_interval
-                command = self.path_map[self.current_piece.x,
-                                        self.current_piece.y,
-                                        self.current_piece.rotation]
+                command = self.path_map.get((self.current_piece.x,
+                                             self.current_piece.y,
+                                             self.current_piece.rotation), '')
                 if not command == '':
                     self.command_queue.append(command)
                     #print(f"add command {command}")
@@ -124,197 +381,431 @@ class AIPlayerBase(Player):
 
     def generate_command(self):
         """
-        Generates the next command for the AI player.
+        Chooses a move for the current piece with `choose_move` and starts placing it.
 
-        This method should be implemented by subclasses.
+        In background mode the move is searched in a worker thread instead, and this
+        only starts the search or picks up its result once it is ready.
         """
-        pass
+        if self.background or self.pipeline:
+            self.plan_in_background()
+            return
+        move = self.choose_move(self.game)
+        if move:
+            self.play(move)
+
+    def play(self, move):
+        """
+        Starts placing the current piece at a chosen move and, when pipelining,
+        starts planning the next piece.
+
+        Args:
+            move (tuple): The placement (x, y, rotation) of the current piece.
+        """
+        self.choice = move
+        self.place_current_piece(move)
+        if not self.pipeline:
+            return
+        predicted = self.game.clone()
+        if predicted.push(*move):
+            return
+        # the live game draws a new preview piece when a piece locks
+        predicted.next_pieces.append(predicted.get_shape())
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        self.cancel_planning.clear()
+        self.pipelined = (self.plan_key(predicted), self.executor.submit(self.plan, predicted))
+
+    def plan_key(self, game):
+        """
+        Returns what a plan depends on: the board, the current piece and the preview.
+
+        Args:
+            game (Engine): The game instance.
+
+        Returns:
+            tuple: The key.
+        """
+        return (tuple(game.board), game.current_piece.shape[0],
+                tuple(piece.shape[0] for piece in game.next_pieces))
+
+    def choose_move(self, game):
+        """
+        Chooses where to place the current piece.
+
+        This method should be implemented by subclasses. It must only read and change
+        the given game, which is a clone of the live game in background mode, and
+        should call `check_cancelled` regularly during long searches.
+
+        Args:
+            game (Engine): The game to choose a move in.
+
+        Returns:
+            tuple: The placement (x, y, rotation), or None if there is none.
+        """
+        return None
+
+    def check_cancelled(self):
+        """
+        Stops a background search whose plan is no longer needed.
+
+        Raises:
+            SearchTimeout: If the running background plan was cancelled.
+        """
+        if self.cancel_planning.is_set():
+            raise SearchTimeout()
+
+    def plan(self, game):
+        """
+        Runs `choose_move` for a background plan.
+
+        Args:
+            game (Engine): The clone of the game to plan on.
+
+        Returns:
+            tuple: The chosen placement, or None if there is none or the plan was cancelled.
+        """
+        try:
+            return self.choose_move(game)
+        except SearchTimeout:
+            return None
+
+    def plan_in_background(self):
+        """
+        Starts a background plan for the current piece, or plays the finished one.
+
+        A pipelined plan is taken over when the next piece spawns. A plan made for a
+        piece that has locked since, for a mispredicted board, or whose move the piece
+        can no longer reach, is cancelled and a new plan is started once the old one stopped.
+        """
+        piece = self.game.current_piece
+        if self.planning is None and self.pipelined is not None:
+            key, self.planning = self.pipelined
+            self.pipelined = None
+            if key == self.plan_key(self.game):
+                self.pipeline_hits += 1
+                self.planned_piece = piece
+            else:
+                self.pipeline_misses += 1
+                self.planned_piece = None
+        if self.planning is not None:
+            if self.planned_piece is not piece:
+                self.cancel_planning.set()
+            if not self.planning.done():
+                return
+            move = self.planning.result()
+            self.planning = None
+            if (self.planned_piece is piece and not self.cancel_planning.is_set() and move
+                    and self.get_reachability(self.game).path_map(tuple(move)) is not None):
+                self.play(move)
+                return
+
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        self.cancel_planning.clear()
+        self.planned_piece = piece
+        self.planning = self.executor.submit(self.plan, self.game.clone())
+
+    def get_pool(self, processes, **kwargs):
+        """
+        Returns the worker pool of a parallel search, starting it on first use. Every
+        worker builds a searcher of this player's class, see `get_worker_player`, and
+        keeps it until `close`.
+
+        Args:
+            processes (int): The number of worker processes.
+            **kwargs: The keyword arguments of the workers' searchers besides their
+                name and game.
+
+        Returns:
+            multiprocessing.Pool: The pool.
+        """
+        if self.pool is None:
+            self.pool_cancel = multiprocessing.Event()
+            self.pool = multiprocessing.Pool(processes, initializer=init_worker,
+                                             initargs=(type(self), kwargs, self.pool_cancel))
+        return self.pool
+
+    def run_in_pool(self, function, tasks):
+        """
+        Runs tasks in the worker pool started by `get_pool`, like `Pool.starmap`, but
+        stops them when the running plan is cancelled.
 
-    # use grass-fire algorithm to find all possible final position of a pieces.
+        The workers' searchers check `pool_cancel` in their `check_cancelled`. It is set
+        when `cancel_planning` is, and cleared again once every task has returned, so
+        the next plan finds the workers idle.
+
+        Args:
+            function (callable): The module-level function run by the workers.
+            tasks (list): The argument tuples of the calls.
+
+        Returns:
+            list: The results of the calls, in order.
+
+        Raises:
+            SearchTimeout: If the running plan was cancelled.
+        """
+        result = self.pool.starmap_async(function, tasks)
+        while not result.ready():
+            result.wait(0.005)
+            if self.cancel_planning.is_set():
+                self.pool_cancel.set()
+                result.wait()
+                self.pool_cancel.clear()
+                raise SearchTimeout()
+        return result.get()
+
+    def close(self):
+        """
+        Cancels the background plan and stops its worker thread and the worker pool,
+        if they were started.
+        """
+        if self.executor is not None:
+            self.cancel_planning.set()
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+            self.planning = None
+            self.pipelined = None
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+    def enable_profiling(self, log_interval=None):
+        """
+        Starts timing and counting the phases of this player's decisions, see `Profile`.
+
+        The profiled methods are wrapped on this instance only, so a player that
+        does not profile runs the plain methods. The `Engine.push` and `Engine.pop`
+        calls of a decision are counted through the `call_counter` of the game it
+        is made on, which the clones of that game share.
+
+        Args:
+            log_interval (float): The seconds between two profile lines printed after
+                a decision, or None to print none.
+        """
+        if self.profile is not None:
+            self.disable_profiling()
+        profile = self.profile = Profile(log_interval)
+
+        for name, (phase, counter, amount) in profiled_methods.items():
+            method = getattr(self, name)
+
+            def profiled(*args, _method=method, _phase=phase, _counter=counter, _amount=amount):
+                start = time.perf_counter()
+                result = _method(*args)
+                if _phase is not None:
+                    profile.record(_phase, time.perf_counter() - start)
+                profile.counters[_counter] += 1 if _amount is None else _amount(result)
+                return result
+
+            setattr(self, name, profiled)
+
+        choose_move = self.choose_move
+
+        def profiled_choose_move(game):
+            start = time.perf_counter()
+            call_counter = game.call_counter
+            calls = game.call_counter = Counter()
+            try:
+                return choose_move(game)
+            finally:
+                game.call_counter = call_counter
+                now = time.perf_counter()
+                profile.record('decision', now - start)
+                profile.counters['decisions'] += 1
+                profile.counters['nodes'] += getattr(self, 'nodes_searched', 0)
+                profile.counters['pushes'] += calls['push']
+                profile.counters['pops'] += calls['pop']
+                if profile.log_interval is not None and now - profile.last_log >= profile.log_interval:
+                    profile.last_log = now
+                    print(f"{self.name} {profile.log_line()}")
+
+        self.choose_move = profiled_choose_move
+
+    def disable_profiling(self):
+        """
+        Stops profiling and restores the plain methods. The last profile stays readable
+        through `profile` until profiling is enabled again.
+        """
+        if self.profile is None or 'choose_move' not in vars(self):
+            return
+        for name in list(profiled_methods) + ['choose_move']:
+            delattr(self, name)
+
+    def profiling_stats(self):
+        """
+        Returns the summary of the current or last profile, see `Profile.stats`.
+
+        Returns:
+            dict: The summary, or an empty dict if the player never profiled.
+        """
+        return self.profile.stats() if self.profile is not None else {}
+
+    # use a breadth-first search to find all possible final position of a pieces.
     def get_possible_states(self, game):
         """
-        Uses a grass-fire algorithm to find all possible final positions for the current piece.
+        Finds all possible final positions for the current piece, see `get_reachability`.
+
+        Args:
+            game (Engine): The current game instance.
+
+        Returns:
+            list of tuples: Each tuple represents a possible state (x, y, rotation) for the piece,
+                ordered by x, then y, then rotation.
+        """
+        return self.get_reachability(game).placements
+
+    def get_reachability(self, game):
+        """
+        Returns the reachable states of the current piece, reusing the last
+        search when it was run on the live game with the same board and piece.
+
+        Args:
+            game (Engine): The current game instance.
+
+        Returns:
+            Reachability: The placements and shortest command paths of the piece.
+        """
+        if game is not self.game:
+            return self.search_reachability(game)
+        piece = game.current_piece
+        key = (tuple(game.board), piece.shape[0], piece.x, piece.y, piece.rotation)
+        if self.reachability is None or self.reachability.key != key:
+            self.reachability = self.search_reachability(game, key)
+        return self.reachability
+
+    def search_reachability(self, game, key=None):
+        """
+        Uses a breadth-first search to find every state the current piece can reach.
+
+        Starting from the piece's current location, every reachable
+        (x, y, rotation) state is visited exactly once. The search first
+        follows the commands the game can execute (left, right, drop and
+        clockwise rotation) and records for every state the one it is reached
+        from in the fewest commands, preferring drops on ties so that the
+        piece is steered before it falls. It then continues through
+        counter-clockwise rotations, which add placements that have no command
+        path. States that cannot move further down are the resting placements.
 
         Args:
-            game (Game): The current game instance.
+            game (Engine): The current game instance.
+            key (tuple): The key to store in the result.
 
         Returns:
-            list of tuples: Each tuple represents a possible state (x, y, rotation) for the piece.
+            Reachability: The placements and shortest command paths of the piece.
         """
         piece = Piece(game.current_piece.x, game.current_piece.y,
                       game.current_piece.shape)
         piece.rotation = game.current_piece.rotation
         orientation = len(piece.shape[1])
-
-        accessible = np.zeros((game.cols + 5, game.rows + 5, orientation),
-                              dtype=bool)
-        # set the spawning point of the 'fire' to the piece's current location
-        accessible[piece.x, piece.y, piece.rotation] = True
-        validity = self.get_position_validity(game, piece)
-
-        hasChange = True
-        while hasChange:
-            hasChange = False
-            for i in range(-2, game.cols + 3):
-                for j in range(0, game.rows + 5):
-                    for rotation in range(orientation):
-                        if not accessible[i, j,
-                                          rotation] and validity[i, j,
-                                                                 rotation]:
-                            # Spread fire to adjacent grass cells
-                            if i > -2 and accessible[i - 1, j, rotation]:
-                                accessible[i, j, rotation] = True
-                                hasChange = True
-                            elif i < game.cols + 2 and accessible[i + 1, j,
-                                                                  rotation]:
-                                accessible[i, j, rotation] = True
-                                hasChange = True
-                            elif j < game.rows + 4 and accessible[i, j - 1,
-                                                                  rotation]:
-                                accessible[i, j, rotation] = True
-                                hasChange = True
-                            elif accessible[i, j, (rotation + 1) %
-                                            orientation] or accessible[
-                                                i, j, rotation - 1]:
-                                accessible[i, j, rotation] = True
-                                hasChange = True
-
-        # next, select out possible final positions that has a ground support the piece
-        possible_states = []
-        for i in range(-2, game.cols + 3):
-            for j in range(game.rows + 5):
-                for rotation in range(orientation):
-                    if accessible[i, j, rotation] and (
-                            j == game.rows + 4
-                            or not validity[i, j + 1, rotation]):
-                        possible_states.append((i, j, rotation))
-
-        # print(f"Possible states: {possible_states}")
+        valid = self.get_position_validity(game, piece).tolist()
+        max_x = game.cols + 2
+        max_y = game.rows + 4
+
+        # set the spawning point of the search to the piece's current location
+        start = (piece.x, piece.y, piece.rotation)
+        parents = {start: None}
+        distances = {start: 0}
+        queue = deque([start])
+        while queue:
+            state = queue.popleft()
+            i, j, rotation = state
+            distance = distances[state] + 1
+            if j + 1 < max_y:
+                neighbour = (i, j + 1, rotation)
+                if neighbour not in parents:
+                    if valid[i][j + 1][rotation]:
+                        parents[neighbour] = state
+                        distances[neighbour] = distance
+                        queue.append(neighbour)
+                elif distances[neighbour] == distance:
+                    parents[neighbour] = state
+            neighbours = [(i, j, (rotation + 1) % orientation)]
+            if i > -2:
+                neighbours.append((i - 1, j, rotation))
+            if i < max_x:
+                neighbours.append((i + 1, j, rotation))
+            for neighbour in neighbours:
+                if neighbour not in parents and valid[neighbour[0]][neighbour[1]][neighbour[2]]:
+                    parents[neighbour] = state
+                    distances[neighbour] = distance
+                    queue.append(neighbour)
+
+        # continue through counter-clockwise rotations
+        reached = set(parents)
+        for i, j, rotation in parents:
+            neighbour = (i, j, (rotation - 1) % orientation)
+            if neighbour not in reached and valid[i][j][neighbour[2]]:
+                reached.add(neighbour)
+                queue.append(neighbour)
+        while queue:
+            i, j, rotation = queue.popleft()
+            neighbours = [(i, j, (rotation + 1) % orientation),
+                          (i, j, (rotation - 1) % orientation)]
+            if i > -2:
+                neighbours.append((i - 1, j, rotation))
+            if i < max_x:
+                neighbours.append((i + 1, j, rotation))
+            if j + 1 < max_y:
+                neighbours.append((i, j + 1, rotation))
+            for neighbour in neighbours:
+                if neighbour not in reached and valid[neighbour[0]][neighbour[1]][neighbour[2]]:
+                    reached.add(neighbour)
+                    queue.append(neighbour)
+
+        # keep the states that has a ground support the piece
+        possible_states = sorted(state for state in reached
+                                 if state[1] == max_y or not valid[state[0]][state[1] + 1][state[2]])
         # print(f"Possible states: {len(possible_states)}")
-        return possible_states
+        return Reachability(key, possible_states, parents)
 
     def get_position_validity(self, game, piece):
         """
         Determines the validity of positions for a given piece.
 
+        The occupancy grid is padded with blocked cells for the walls and the
+        floor, then for every rotation the shifted windows under each of the
+        piece's cells are OR-ed together, giving the whole placement lattice
+        in a few numpy operations.
+
         Args:
-            game (Game): The current game instance.
-            piece (Piece): The piece to check.
+            game (Engine): The current game instance.
+            piece (Piece): The piece to check. Only its shape is used.
 
         Returns:
-            np.ndarray: A boolean array indicating the validity of positions for the piece.
+            np.ndarray: A boolean array indicating the validity of positions for the piece,
+                indexed by [x, y, rotation] for x in -2..cols+2 and y in 0..rows+4.
         """
+        width = game.cols + 5
+        height = game.rows + 5
+        # blocked[cx + 4, cy + 4] for every cell a piece in the lattice can cover
+        blocked = np.ones((width + 4, height + 4), dtype=bool)
+        blocked[4:game.cols + 4, :game.rows + 4] = False
+        blocked[4:game.cols + 4, 5:game.rows + 4] = ~game.accepted_positions[:, 1:]
+
         orientation = len(piece.shape[1])
-        validity = np.zeros(
-            (game.cols + 5, game.rows + 5, orientation),
-            dtype=bool)
-        for piece.x in range(-2, game.cols + 3):
-            for piece.y in range(0, game.rows + 5):
-                for piece.rotation in range(orientation):
-                    if game.valid_space(piece):
-                        validity[piece.x, piece.y, piece.rotation] = True
-        return validity
+        validity = np.empty((width, height, orientation), dtype=bool)
+        for rotation in range(orientation):
+            covered = np.zeros((width, height), dtype=bool)
+            for j, i in formats[(piece.shape[0], rotation)]:
+                covered |= blocked[j:j + width, i:i + height]
+            validity[:, :, rotation] = ~covered
+        # the lattice starts at x = -2, which is stored at the end of the array
+        return np.roll(validity, -2, axis=0)
 
     def place_current_piece(self, position):
         """
         Places the current piece at the given position and calculates the path for placement.
 
+        The path is backtraced from the same search that enumerated the
+        placements, so planning does not traverse the board again.
+
         Args:
             position (tuple): The target position (x, y, rotation) for placing the piece.
         """
-        piece = Piece(self.game.current_piece.x, self.game.current_piece.y,
-                      self.game.current_piece.shape)
-        piece.rotation = self.game.current_piece.rotation
-        orientation = len(piece.shape[1])
-        dtype = np.dtype([('direction', 'S10'), ('distance', 'i4')])
-        default_value = np.array([('unknown', 999)], dtype=dtype)
-        directions = np.full(
-            (self.game.cols + 5, self.game.rows + 5, orientation),
-            default_value,
-            dtype=dtype)
-        # set the spawning point of the 'fire' to the piece's current location
-        directions[piece.x, piece.y, piece.rotation] = np.array([('none', 0)],
-                                                                dtype=dtype)
-
-        validity = self.get_position_validity(self.game, piece)
-
-        # use grassfire to calculate directions
-        hasChange = True
-        while hasChange:
-            hasChange = False
-            for i in range(-2, self.game.cols + 3):
-                for j in range(0, self.game.rows + 5):
-                    for rotation in range(orientation):
-                        if validity[i, j, rotation]:
-                            # Spread fire to adjacent grass cells
-                            if i > -2 and directions[i - 1, j, rotation][
-                                    "distance"] + 1 < directions[
-                                        i, j, rotation]["distance"]:
-                                directions[i, j,
-                                           rotation]["distance"] = directions[
-                                               i - 1, j,
-                                               rotation]["distance"] + 1
-                                directions[i, j,
-                                           rotation]["direction"] = "left"
-                                hasChange = True
-                            elif i < self.game.cols + 2 and directions[i + 1, j, rotation]["distance"] + 1 < \
-                                    directions[i, j, rotation]["distance"]:
-                                directions[i, j,
-                                           rotation]["distance"] = directions[
-                                               i + 1, j,
-                                               rotation]["distance"] + 1
-                                directions[i, j,
-                                           rotation]["direction"] = "right"
-                                hasChange = True
-                            elif directions[i, j, (rotation - 1) % orientation]["distance"] + 1 < \
-                                    directions[i, j, rotation]["distance"]:
-                                directions[
-                                    i, j, rotation]["distance"] = directions[
-                                        i, j, (rotation - 1) %
-                                        orientation]["distance"] + 1
-                                directions[i, j,
-                                           rotation]["direction"] = "clockwise"
-                                hasChange = True
-                            elif (j < self.game.rows + 4 and not directions[i, j, rotation]["direction"] == b"up"
-                                  and directions[i, j - 1, rotation]["distance"] < \
-                                    directions[i, j, rotation]["distance"]):
-                                directions[i, j,
-                                           rotation]["distance"] = directions[
-                                               i, j - 1,
-                                               rotation]["distance"] + 1
-                                directions[i, j, rotation]["direction"] = "up"
-                                hasChange = True
-
-        # backtrace to find path
-        i = position[0]
-        j = position[1]
-        rotation = position[2]
-        self.path_map = np.zeros(
-            (self.game.cols + 5, self.game.rows + 5, orientation),
-            dtype='U10')
-        distance = directions[i, j, rotation]["distance"]
-        last_distance = distance
-        while not directions[i, j, rotation]["direction"] == b"none":
-            # Spread fire to adjacent grass cells
-            if directions[i, j, rotation]["direction"] == b"left":
-                i -= 1
-                distance -= 1
-                self.path_map[i, j, rotation] = "right"
-            elif directions[i, j, rotation]["direction"] == b"right":
-                i += 1
-                distance -= 1
-                self.path_map[i, j, rotation] = 'left'
-            elif directions[i, j, rotation]["direction"] == b"up":
-                j -= 1
-                distance -= 1
-                self.path_map[i, j, rotation] = 'drop'
-            elif directions[i, j, rotation]["direction"] == b"clockwise":
-                rotation = (rotation + 3) % orientation
-                distance -= 1
-                self.path_map[i, j, rotation] = 'rotate'
-            if last_distance == distance:
-                print("we lost")
-                break
+        self.path_map = self.get_reachability(self.game).path_map(tuple(position))
+        if self.path_map is None:
+            print("we lost")
+            self.path_map = {}
         self.placing_piece = True
         self.moving_piece = True
         self.current_piece = self.game.current_piece
@@ -0,0 +1,123 @@
+import numpy as np
+
+from AIPlayerBase import AIPlayerBase
+
+
+class BeamSearchPlayer(AIPlayerBase):
+    """
+    AI player that searches the next pieces with a beam search.
+
+    Inherits from:
+        AIPlayerBase: Base class for AI players.
+
+    Only the `beam_width` best boards of every ply, according to `evaluate_state`,
+    are expanded, so a decision costs about depth * beam_width placement searches
+    instead of growing exponentially with the depth.
+
+    Attributes:
+        depth (int): The number of pieces placed in the search, counting the current
+            piece. It is capped by the preview, so at most 1 + len(next_pieces).
+        beam_width (int): The number of boards kept at each ply.
+        nodes_searched (int): The number of distinct boards evaluated by the last search.
+    """
+
+    def __init__(self, name, game, depth=6, beam_width=8):
+        """
+        Initializes a BeamSearchPlayer with the given name, game, search depth and beam width.
+
+        Args:
+            name (str): The name of the player.
+            game (Engine): The game instance that the player is interacting with.
+            depth (int): The number of pieces to place in the search. Defaults to 6,
+                the current piece and the 5 preview pieces.
+            beam_width (int): The number of boards kept at each ply. Defaults to 8.
+        """
+        super().__init__(name, game)
+        self.depth = depth
+        self.beam_width = beam_width
+        self.nodes_searched = 0
+
+    def beam_search(self, game):
+        """
+        Runs the beam search from the current state of a game.
+
+        Args:
+            game (Engine): The game instance to search from. It is left unchanged.
+
+        Returns:
+            tuple: The best evaluation found and the sequence of placements (x, y, rotation)
+                leading to it, or (None, []) if the current piece cannot be placed. When
+                every placement of the current piece loses, the sequence is the best
+                evaluated of them.
+        """
+        depth = max(1, min(self.depth, 1 + len(game.next_pieces)))
+        # every entry is (placements so far, game after those placements)
+        beam = [([], game.clone())]
+        best = (None, [])
+        self.nodes_searched = 0
+        for ply in range(depth):
+            self.check_cancelled()
+            losing = []  # (placement, board, score) of the current piece's losing placements
+            sequences = []
+            parents = []
+            boards = []
+            scores = []
+            seen = set()
+            for sequence, state in beam:
+                for x, y, rotation in self.get_possible_states(state):
+                    lost = state.push(x, y, rotation)
+                    board = tuple(state.board)
+                    if lost:
+                        if not ply:
+                            losing.append(((x, y, rotation), board, state.score))
+                    elif (board, state.score) not in seen:
+                        # different placement orders often build the same board
+                        seen.add((board, state.score))
+                        sequences.append(sequence + [(x, y, rotation)])
+                        parents.append(state)
+                        boards.append(board)
+                        scores.append(state.score)
+                    state.pop()
+            if not sequences:
+                if losing:
+                    # every placement of the current piece loses, so play the least bad one
+                    self.nodes_searched += len(losing)
+                    evals = self.evaluate_batch(np.array([board for _, board, _ in losing]),
+                                                [score for _, _, score in losing])
+                    index = int(np.argmax(evals))
+                    best = (int(evals[index]), [losing[index][0]])
+                break
+
+            self.nodes_searched += len(boards)
+            evals = self.evaluate_batch(np.array(boards), scores)
+            order = np.argsort(-evals, kind='stable')[:self.beam_width]
+            best = (int(evals[order[0]]), sequences[order[0]])
+            beam = []
+            for i in order:
+                state = parents[i].clone()
+                state.push(*sequences[i][-1])
+                beam.append((sequences[i], state))
+        return best
+
+    def choose_move(self, game):
+        """
+        Chooses the move for the current piece using the beam search.
+
+        Args:
+            game (Engine): The game to choose a move in.
+
+        Returns:
+            tuple: The first placement (x, y, rotation) of the best sequence found, or None
+                if the current piece cannot be placed at all.
+        """
+        _, sequence = self.beam_search(game)
+        return sequence[0] if sequence else None
+
+    def update(self, update_time):
+        """
+        Updates the AI player by processing game state changes and making decisions.
+
+        Args:
+            update_time (int): The time elapsed since the last update, used for timing control.
+        """
+        super().update(update_time)
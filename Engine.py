@@ -0,0 +1,701 @@
+"""
+This module defines the Engine class, the pure game logic of Tetris without
+any rendering. It imports neither pygame nor any display code, so it can be
+used for simulations and in worker processes.
+
+The engine covers:
+- A grid of 10 columns and 20 rows stored as one integer bitmask per row.
+- Falling pieces represented by the Piece class.
+- A random piece generator with a configurable seed for reproducibility.
+- Game controls for moving, rotating, and dropping pieces.
+- Checking for valid positions, row clearing, scoring and game over conditions.
+- Placing pieces with push and undoing them with pop for search.
+- Cheap clones and compact snapshots that can be restored in place.
+- Column heights, hole counts and row fill counts kept up to date as pieces
+  are placed, rows are cleared and moves are undone.
+- A Zobrist hash of the board, kept up to date the same way.
+
+Classes:
+    - MoveRecord: The undo record of one placement.
+    - Engine: The headless game state and rules.
+
+Functions:
+    - build_piece_masks(cols): Precomputes the row bitmasks of every piece
+      placement.
+    - build_zobrist_table(cols, rows): Precomputes the hash key of every row
+      content.
+"""
+import random
+from functools import lru_cache
+
+import numpy as np
+
+import Piece
+
+# shape name -> (shape, color), used to rebuild pieces from snapshots
+shapes_by_name = {shape[0]: (shape, Piece.shape_colors[i])
+                  for i, shape in enumerate(Piece.shape_list)}
+
+
+@lru_cache(maxsize=None)
+def build_piece_masks(cols):
+    """
+    Precomputes the row bitmasks of every piece placement.
+
+    For each (shape, rotation) in `Piece.formats` and each x in the placement
+    lattice (-2 to cols + 2), the cells of the piece are folded into one
+    bitmask per occupied row, bit `c` standing for column `c`. The table is
+    built once per grid width and shared by every game.
+
+    Args:
+        cols (int): The number of columns in the game grid.
+
+    Returns:
+        dict: Maps (shape name, rotation) to a list indexed by x + 2. Each
+            entry is a tuple of (row offset, bitmask) pairs relative to the
+            piece's y, or None if the piece sticks out of the side walls.
+    """
+    masks = {}
+    for key, positions in Piece.formats.items():
+        per_x = []
+        for x in range(-2, cols + 3):
+            rows = {}
+            for j, i in positions:
+                column = j + x - 2
+                if column < 0 or column >= cols:
+                    rows = None
+                    break
+                rows[i - 4] = rows.get(i - 4, 0) | (1 << column)
+            per_x.append(tuple(sorted(rows.items())) if rows is not None else None)
+        masks[key] = per_x
+    return masks
+
+
+@lru_cache(maxsize=None)
+def build_zobrist_table(cols, rows):
+    """
+    Precomputes the Zobrist keys of the board hash.
+
+    Every cell gets a random 64-bit key and the hash of a board is the XOR
+    of the keys of its occupied cells. The keys are folded per row, so the
+    hash of a row with bitmask `mask` at height `y` is `table[y][mask]`. The
+    generator has a fixed seed, so hashes agree across processes.
+
+    Args:
+        cols (int): The number of columns in the game grid.
+        rows (int): The number of rows in the game grid.
+
+    Returns:
+        list: One list per row, indexed by the row bitmask.
+    """
+    randomizer = random.Random(0x5EED)
+    table = []
+    for _ in range(rows):
+        keys = [0] * (1 << cols)
+        for mask in range(1, 1 << cols):
+            low = mask & -mask
+            if low == mask:
+                keys[mask] = randomizer.getrandbits(64)
+            else:
+                keys[mask] = keys[mask ^ low] ^ keys[low]
+        table.append(keys)
+    return table
+
+
+class MoveRecord:
+    """
+    The undo record of one placement, reused by the ring buffer of `Engine.history`.
+
+    Attributes:
+        piece_state (tuple): The x, y, shape and rotation of the current piece
+            before the placement.
+        rows (tuple): The (row offset, bitmask) pairs of the placed cells, see
+            `Engine.piece_rows`.
+        y (int): The y-coordinate the piece was placed at.
+        cleared (tuple): The indices of the rows the placement cleared.
+        overflow (int): `Engine.overflow` before the placement.
+        score (int): `Engine.score` before the placement.
+        heights (list): `Engine.heights` before the placement.
+        column_holes (list): `Engine.column_holes` before the placement.
+        board_hash (int): `Engine.board_hash` before the placement.
+    """
+    __slots__ = ('piece_state', 'rows', 'y', 'cleared', 'overflow', 'score', 'heights',
+                 'column_holes', 'board_hash')
+
+    def __init__(self, heights, column_holes):
+        """
+        Initializes an empty record around copies of the column features.
+
+        Args:
+            heights (list): The column heights to copy.
+            column_holes (list): The column hole counts to copy.
+        """
+        self.piece_state = None
+        self.rows = None
+        self.y = None
+        self.cleared = None
+        self.overflow = None
+        self.score = None
+        self.heights = heights[:]
+        self.column_holes = column_holes[:]
+        self.board_hash = None
+
+
+class Engine:
+    """
+    A class to represent the logic of a Tetris game, without rendering.
+
+    Attributes:
+        randomizer (random.Random): A random number generator with a set seed.
+            Clones and restored games create or resync it lazily from a
+            saved state the first time a new piece is generated.
+        cols (int): The number of columns in the game grid (default is 10).
+        rows (int): The number of rows in the game grid (default is 20).
+        board (list): One integer bitmask per row; bit `x` of `board[y]` is set
+            when the cell (x, y) is occupied. This is the source of truth for
+            collisions, row clearing and game over checks.
+        full_row (int): The bitmask of a completely filled row.
+        piece_masks (dict): Row bitmasks of every piece placement, see
+            `build_piece_masks`.
+        overflow (int): The number of locked cells that ended up above the top
+            of the grid.
+        heights (list): The height of every column, counted from the floor to
+            its topmost locked cell.
+        column_holes (list): For every column, the number of empty cells that
+            sit right below a locked cell.
+        row_fills (list): The number of locked cells in every row.
+        zobrist (list): The hash keys of every row content, see `build_zobrist_table`.
+        board_hash (int): The Zobrist hash of `board`.
+        run (bool): A flag indicating whether the game is running.
+        current_piece (Piece): The current piece that the player is controlling.
+        next_pieces (list): A list of the next 5 pieces that will be played.
+        score (int): The player's current score.
+        piece_dropped (bool): A flag indicating whether the current piece has been dropped.
+        accepted_positions (np.ndarray): A 2D numpy array indicating valid positions on the grid,
+            derived from `board` on demand.
+        history (list): A ring buffer of reusable `MoveRecord`s. Each record
+            only holds the cells a placement added and the rows it cleared.
+        history_start (int): The index of the oldest record in `history`.
+        history_size (int): The number of moves that can currently be undone.
+        call_counter (Counter): Counts the `push` and `pop` calls on this game and
+            on the clones made from it, while a profiling player sets it, or None.
+    """
+    def __init__(self, seed, history_limit=64):
+        """
+        Initializes the Engine object with a given seed for randomization.
+
+        Args:
+            seed (int): The seed for the random number generator.
+            history_limit (int): The maximum number of moves kept for undo.
+                When it is exceeded, the oldest moves can no longer be undone.
+        """
+        self.randomizer = random.Random(seed)
+        self._rng_state = None
+        self._rng_stale = False
+        self.cols = 10
+        self.rows = 20
+        self.board = [0] * self.rows
+        self.full_row = (1 << self.cols) - 1
+        self.piece_masks = build_piece_masks(self.cols)
+        self.zobrist = build_zobrist_table(self.cols, self.rows)
+        self.overflow = 0
+        self.update_features()
+        self.run = True
+        self.current_piece = self.get_shape()
+        self.next_pieces = [self.get_shape()
+                            for _ in range(5)]  # next 5 pieces
+        self.score = 0
+        self.piece_dropped = False
+        self._accepted_positions = None
+        self.history = [None] * history_limit  # keep track of the history
+        self.history_start = 0
+        self.history_size = 0
+        self.call_counter = None
+
+    def update_piece(self, shape_pos, generate_new_piece=False):
+        """
+        Locks the current piece's position on the grid and optionally generates a new piece.
+
+        Args:
+            shape_pos (list): The positions of the piece to lock on the grid.
+            generate_new_piece (bool): Whether to generate a new piece after locking the current one.
+
+        Returns:
+            tuple: The indices of the rows the piece cleared, see `clear_rows`.
+        """
+        board = self.board
+        heights = self.heights
+        column_holes = self.column_holes
+        rows = self.rows
+        for x, y in shape_pos:
+            if y < 0:
+                self.overflow += 1
+                continue
+            bit = 1 << x
+            if board[y] & bit:
+                continue
+            # the cell no longer is a hole, but the one below may become one
+            if y > 0 and board[y - 1] & bit:
+                column_holes[x] -= 1
+            if y + 1 < rows and not board[y + 1] & bit:
+                column_holes[x] += 1
+            if rows - y > heights[x]:
+                heights[x] = rows - y
+            board[y] |= bit
+            self.row_fills[y] += 1
+            self.board_hash ^= self.zobrist[y][bit]
+        self._accepted_positions = None
+        self.current_piece = self.next_pieces.pop(
+            0)  # take next from next_pieces
+        if generate_new_piece:
+            self.next_pieces.append(
+                self.get_shape())  # add a new piece into next_pieces
+
+        return self.clear_rows()
+
+    def convert_shape_format(self, shape: Piece):
+        """
+        Converts the shape's format to a list of grid positions.
+
+        Args:
+            shape (Piece): The piece to convert.
+
+        Returns:
+            list: A list of tuples representing the positions of the shape on the grid.
+        """
+        positions = Piece.formats[(shape.shape[0],shape.rotation)].copy()
+        for i, pos in enumerate(positions):
+            positions[i] = (pos[0] + shape.x - 2, pos[1] + shape.y - 4)
+
+        # print(f"Converted shape positions: {positions}")  # debug print
+        return positions
+
+    def update_features(self):
+        """
+        Recomputes the column heights, hole counts, row fill counts and the
+        board hash from the board. Call it after writing to `board` directly.
+        """
+        board = self.board
+        self.board_hash = self.hash_board()
+        self.heights = [0] * self.cols
+        self.column_holes = [0] * self.cols
+        self.row_fills = [bin(row).count('1') for row in board]
+        for x in range(self.cols):
+            bit = 1 << x
+            for y in range(self.rows):
+                if board[y] & bit:
+                    self.heights[x] = self.rows - y
+                    break
+            for y in range(1, self.rows):
+                if not board[y] & bit and board[y - 1] & bit:
+                    self.column_holes[x] += 1
+
+    def hash_board(self):
+        """
+        Computes the Zobrist hash of the board from scratch.
+
+        Returns:
+            int: The XOR of the keys of every occupied cell.
+        """
+        board_hash = 0
+        for keys, row in zip(self.zobrist, self.board):
+            board_hash ^= keys[row]
+        return board_hash
+
+    @property
+    def accepted_positions(self):
+        """
+        np.ndarray: A (cols, rows) boolean array that is True for empty cells,
+        rebuilt from `board` the first time it is read after a change.
+        """
+        if self._accepted_positions is None:
+            self.update_valid_positions()
+        return self._accepted_positions
+
+    def update_valid_positions(self):
+        """
+        Updates the accepted positions on the grid based on the board.
+        """
+        bits = np.array(self.board)[:, None] >> np.arange(self.cols)
+        self._accepted_positions = ((bits & 1) == 0).T
+
+    def piece_rows(self, shape: Piece):
+        """
+        Looks up the row bitmasks covered by a piece.
+
+        Args:
+            shape (Piece): The piece to look up.
+
+        Returns:
+            tuple: (row offset, bitmask) pairs relative to the piece's y, or
+                None if the piece sticks out of the side walls.
+        """
+        lattice = self.piece_masks[(shape.shape[0], shape.rotation)]
+        if 0 <= shape.x + 2 < len(lattice):
+            return lattice[shape.x + 2]
+        return None
+
+    def collides(self, rows, y):
+        """
+        Checks a piece's row bitmasks against the board.
+
+        Rows above the grid, as well as the top row, are treated as open so
+        that pieces can spawn and rotate there.
+
+        Args:
+            rows (tuple): (row offset, bitmask) pairs from `piece_rows`.
+            y (int): The y-coordinate of the piece.
+
+        Returns:
+            bool: True if the piece overlaps the floor or a locked cell.
+        """
+        board = self.board
+        for dy, mask in rows:
+            row = y + dy
+            if row >= self.rows or (row > 0 and board[row] & mask):
+                return True
+        return False
+
+    def valid_space(self, shape: Piece):
+        """
+        Checks if the current piece is in a valid position on the grid.
+
+        Args:
+            shape (Piece): The piece to check.
+
+        Returns:
+            bool: True if the piece is in a valid position, False otherwise.
+        """
+        rows = self.piece_rows(shape)
+        return rows is not None and not self.collides(rows, shape.y)
+
+    def check_lost(self):
+        """
+        Checks if the player has lost the game.
+
+        Returns:
+            bool: True if a locked cell reached the top row, False otherwise.
+        """
+        return self.board[0] != 0 or self.overflow > 0
+
+    def get_shape(self):
+        """
+        Returns a new random piece.
+
+        Returns:
+            Piece: A new randomly generated piece.
+        """
+        if self._rng_stale:
+            if self.randomizer is None:
+                self.randomizer = random.Random()
+            self.randomizer.setstate(self._rng_state)
+            self._rng_stale = False
+        self._rng_state = None
+        return Piece.Piece(5, 0, Piece.shape_list[self.randomizer.randint(0,len(Piece.shapes)-1)])
+
+    def rng_state(self):
+        """
+        Returns the state of the piece generator, capturing it only once
+        between two generated pieces.
+
+        Returns:
+            tuple: The state of `randomizer`, as given by `random.Random.getstate`.
+        """
+        if self._rng_state is None:
+            self._rng_state = self.randomizer.getstate()
+        return self._rng_state
+
+    def clear_rows(self):
+        """
+        Clears every full row from the board in a single pass, shifts down the
+        rows above and adds the line clear bonus to the score.
+
+        The rows do not need to be contiguous. The column heights, hole counts
+        and row fill counts are updated from the cleared rows alone.
+
+        Returns:
+            tuple: The indices of the cleared rows before clearing, from top to bottom.
+        """
+        full_row = self.full_row
+        board = self.board
+        cleared = tuple(y for y, row in enumerate(board) if row == full_row)
+        if not cleared:
+            return cleared
+        heights = self.heights
+        column_holes = self.column_holes
+        rows = self.rows
+        inc = len(cleared)
+
+        # the cells right above and below every run of cleared rows become neighbours
+        top = cleared[0]
+        for i, y in enumerate(cleared):
+            if i + 1 < inc and cleared[i + 1] == y + 1:
+                continue
+            above = board[top - 1] if top > 0 else 0
+            below = board[y + 1] if y + 1 < rows else full_row
+            merged = full_row & ~above & ~below
+            while merged:
+                column_holes[(merged & -merged).bit_length() - 1] -= 1
+                merged &= merged - 1
+            if i + 1 < inc:
+                top = cleared[i + 1]
+
+        # every column reaches the top cleared row; the taller ones just sink
+        level = rows - cleared[0]
+        for x in range(self.cols):
+            if heights[x] > level:
+                heights[x] -= inc
+            else:
+                # the row held the column's top cell, look for the next one
+                heights[x] = 0
+                bit = 1 << x
+                for lower in range(cleared[0] + 1, rows):
+                    if board[lower] & bit and board[lower] != full_row:
+                        heights[x] = rows - lower - sum(1 for y in cleared if y > lower)
+                        break
+
+        board[:] = [0] * inc + [row for row in board if row != full_row]
+        self.row_fills[:] = [0] * inc + [fill for fill in self.row_fills if fill != self.cols]
+        # every row above the cleared ones moved, so rehash
+        self.board_hash = self.hash_board()
+        self._accepted_positions = None
+        if inc == 1:
+            self.score += 10
+        elif inc == 2:
+            self.score += 25
+        elif inc == 3:
+            self.score += 45
+        elif inc == 4:
+            self.score += 70
+        return cleared
+
+    def move_left(self):
+        """
+        Moves the current piece one position to the left if possible.
+        """
+        self.current_piece.x -= 1
+        if not self.valid_space(self.current_piece):
+            self.current_piece.x += 1
+
+    def move_right(self):
+        """
+        Moves the current piece one position to the right if possible.
+        """
+        self.current_piece.x += 1
+        if not self.valid_space(self.current_piece):
+            self.current_piece.x -= 1
+
+    def rotate_piece(self):
+        """
+        Rotates the current piece clockwise if the new position is valid.
+        """
+        self.current_piece.rotation = (self.current_piece.rotation + 1) % len(
+            self.current_piece.shape[1])
+        if not self.valid_space(self.current_piece):
+            self.current_piece.rotation = self.current_piece.rotation - 1 % len(
+                self.current_piece.shape[1])
+
+    def drop_piece(self):
+        """
+        Drops the current piece by one position if possible.
+        """
+        self.current_piece.y += 1
+        if not self.valid_space(self.current_piece):
+            self.current_piece.y -= 1
+        else:
+            self.piece_dropped = True
+
+    def push(self, x, y, rotation):
+        """
+        Places the current piece on the grid and updates the game state.
+
+        Args:
+            x (int): The x-coordinate of the piece.
+            y (int): The y-coordinate of the piece.
+            rotation (int): The rotation state of the piece.
+
+        Returns:
+            bool: True if the player has lost after the move, False otherwise.
+        """
+        if self.call_counter is not None:
+            self.call_counter['push'] += 1
+        piece = self.current_piece
+        placed = Piece.Piece(x, y, piece.shape, rotation)
+        rows = self.piece_rows(placed)
+
+        # reuse the record that sits in the next slot of the ring buffer
+        limit = len(self.history)
+        if self.history_size == limit:
+            self.history_start = (self.history_start + 1) % limit
+            self.history_size -= 1
+        index = (self.history_start + self.history_size) % limit
+        record = self.history[index]
+        if record is None:
+            record = self.history[index] = MoveRecord(self.heights, self.column_holes)
+        else:
+            record.heights[:] = self.heights
+            record.column_holes[:] = self.column_holes
+        record.piece_state = (piece.x, piece.y, piece.shape, piece.rotation)
+        record.rows = rows
+        record.y = y
+        record.overflow = self.overflow
+        record.score = self.score
+        record.board_hash = self.board_hash
+        self.history_size += 1
+
+        # Add the piece to the grid
+        record.cleared = self.update_piece(self.convert_shape_format(placed))
+        if not self.next_pieces:
+            self.next_pieces.append(self.get_shape())
+        return self.check_lost()
+
+    def pop(self):
+        """
+        Reverts the game state to the previous move by replaying its undo
+        record in reverse.
+
+        Returns:
+            Engine: The game instance after undoing the last move.
+        """
+        if self.call_counter is not None:
+            self.call_counter['pop'] += 1
+        if not self.history_size:
+            return self  # no action to undo
+
+        self.history_size -= 1
+        record = self.history[(self.history_start + self.history_size) % len(self.history)]
+        board = self.board
+
+        row_fills = self.row_fills
+
+        # put the cleared rows back where they were
+        cleared = record.cleared
+        if cleared:
+            del board[:len(cleared)]
+            del row_fills[:len(cleared)]
+            for row in cleared:
+                board.insert(row, self.full_row)
+                row_fills.insert(row, self.cols)
+
+        # then take the piece's cells out again
+        y = record.y
+        for dy, mask in record.rows:
+            if y + dy >= 0:
+                board[y + dy] &= ~mask
+                row_fills[y + dy] -= bin(mask).count('1')
+        self.heights[:] = record.heights
+        self.column_holes[:] = record.column_holes
+        self.overflow = record.overflow
+        self.score = record.score
+        self.board_hash = record.board_hash
+        self._accepted_positions = None
+
+        self.next_pieces.insert(0,self.current_piece.copy())
+
+        self.current_piece.x, self.current_piece.y, self.current_piece.shape, self.current_piece.rotation = record.piece_state
+
+        return self
+
+    def quit(self):
+        """
+        Stops the game.
+        """
+        self.run = False
+
+    def clone(self):
+        """
+        Creates a cheap headless copy of the current game state.
+
+        Only the board, the current and queued pieces, the score and the state
+        of the piece generator are copied; the clone starts with an empty
+        history. The clone is always a plain Engine, even when called on a
+        rendered Game, so that simulations do not carry any drawing state.
+
+        Returns:
+            Engine: A new Engine instance with the same state as the current game.
+        """
+        new_game = Engine.__new__(Engine)
+        new_game.randomizer = None
+        new_game._rng_state = self.rng_state()
+        new_game._rng_stale = True
+        new_game.cols = self.cols
+        new_game.rows = self.rows
+        new_game.board = self.board[:]
+        new_game.full_row = self.full_row
+        new_game.piece_masks = self.piece_masks
+        new_game.zobrist = self.zobrist
+        new_game.board_hash = self.board_hash
+        new_game.overflow = self.overflow
+        new_game.heights = self.heights[:]
+        new_game.column_holes = self.column_holes[:]
+        new_game.row_fills = self.row_fills[:]
+        new_game.run = self.run
+        new_game.current_piece = self.current_piece.copy()
+        new_game.next_pieces = [piece.copy() for piece in self.next_pieces]
+        new_game.score = self.score
+        new_game.piece_dropped = False
+        new_game._accepted_positions = self._accepted_positions
+        new_game.history = [None] * len(self.history)
+        new_game.history_start = 0
+        new_game.history_size = 0
+        new_game.call_counter = self.call_counter
+        return new_game
+
+    def copy(self):
+        """
+        Creates a headless copy of the current game state, see `clone`.
+
+        Returns:
+            Engine: A new Engine instance with the same state as the current game.
+        """
+        return self.clone()
+
+    def snapshot(self):
+        """
+        Captures the game state in a compact, picklable form.
+
+        Returns:
+            tuple: The board, overflow, score, run flag, the current and queued
+                pieces as (shape name, x, y, rotation), the generator state and
+                the column heights, hole counts and row fill counts.
+        """
+        pieces = tuple((piece.shape[0], piece.x, piece.y, piece.rotation)
+                       for piece in [self.current_piece] + self.next_pieces)
+        return (tuple(self.board), self.overflow, self.score, self.run, pieces,
+                self.rng_state(), tuple(self.heights), tuple(self.column_holes),
+                tuple(self.row_fills))
+
+    def restore(self, snapshot):
+        """
+        Resets this game in place to a state captured by `snapshot`.
+
+        The existing board list and piece objects are reused, so a
+        preallocated game can be restored over and over without allocating
+        new ones. The undo history is emptied.
+
+        Args:
+            snapshot (tuple): A state returned by `snapshot`.
+        """
+        (board, self.overflow, self.score, self.run, pieces, rng_state,
+         heights, column_holes, row_fills) = snapshot
+        self.board[:] = board
+        self.heights[:] = heights
+        self.column_holes[:] = column_holes
+        self.row_fills[:] = row_fills
+        self.board_hash = self.hash_board()
+        self._accepted_positions = None
+
+        next_pieces = self.next_pieces
+        del next_pieces[len(pieces) - 1:]
+        while len(next_pieces) < len(pieces) - 1:
+            next_pieces.append(self.current_piece.copy())
+        for piece, (name, x, y, rotation) in zip([self.current_piece] + next_pieces, pieces):
+            piece.shape, piece.color = shapes_by_name[name]
+            piece.x = x
+            piece.y = y
+            piece.rotation = rotation
+
+        self._rng_state = rng_state
+        self._rng_stale = True
+        self.history_start = 0
+        self.history_size = 0
@@ -5,17 +5,14 @@ the top, and the player can move, rotate, and drop these pieces to fill rows.
 Completed rows are cleared from the grid, and the player's score increases
 accordingly.
 
-The game mechanics include:
-- A grid of 10 columns and 20 rows.
-- Falling pieces represented by the Piece class.
-- A random piece generator with a configurable seed for reproducibility.
-- Game controls for moving, rotating, and dropping pieces.
-- Checking for valid positions, row clearing, and game over conditions.
+The rules themselves live in the headless Engine class; Game layers the
+real-time loop and the drawing on top of it:
+- Piece falling driven by the elapsed frame time.
+- Keeping the colors of locked pieces for drawing.
 - Drawing the game window, grid, and next pieces using Pygame.
 
 Classes:
-    - Game: The main game class handling the game state, piece movement, and
-      rendering.
+    - Game: The main game class handling the game loop and rendering.
       
 Functions:
     - draw_text_middle(text, size, color, surface): Draws text centered in
@@ -23,11 +20,10 @@ Functions:
     - draw_text(text, size, color, surface, x, y): Draws text at a specified
       position in the game window.
 """
-import random
-
-import numpy as np
 import pygame
+
 import Piece
+from Engine import Engine
 
 s_width = 600
 s_height = 700
@@ -36,35 +32,32 @@ play_height = 600  # meaning 600 // 20 = 20 height per blo ck
 play_offset = 120  # meaning 600 // 20 = 20 height per blo ck
 
 block_size = 30
+locked_color = (128, 128, 128)  # color of restored cells whose piece is unknown
 
 top_left_x = (s_width - play_width - play_offset) // 2
 top_left_y = s_height - play_height
 
 
-class Game:
+class Game(Engine):
     """
     A class to represent the Tetris game.
 
+    Inherits from:
+        Engine: The headless game logic.
+
     Attributes:
         grid (list): A 2D list representing the current state of the game grid.
         debug_grid (list): A 2D list used for debugging the game grid.
-        randomizer (random.Random): A random number generator with a set seed.
-        cols (int): The number of columns in the game grid (default is 10).
-        rows (int): The number of rows in the game grid (default is 20).
-        locked_positions (dict): A dictionary storing the locked positions on
-            the grid and their corresponding colors.
+        locked_positions (dict): A dictionary storing the colors of the locked
+            positions, used for drawing only.
+        locked_history (list): For every move in `history`, at the same index as its
+            undo record, the cells of the piece and the colors its cells and the
+            rows it cleared held before the move.
         change_piece (bool): A flag indicating whether to change the current piece.
-        run (bool): A flag indicating whether the game is running.
-        current_piece (Piece): The current piece that the player is controlling.
-        next_pieces (list): A list of the next 5 pieces that will be played.
         player (AIPlayerBase): The player controlling the game.
         fall_time (int): A counter for the time since the last piece drop.
         level_time (int): A counter for the time since the level started.
         fall_speed (float): The speed at which the current piece falls.
-        score (int): The player's current score.
-        piece_dropped (bool): A flag indicating whether the current piece has been dropped.
-        accepted_positions (np.ndarray): A 2D numpy array indicating valid positions on the grid.
-        history (list): A list storing the game history for undo functionality.
     """
     def __init__(self, seed):
         """
@@ -73,28 +66,19 @@ class Game:
         Args:
             seed (int): The seed for the random number generator.
         """
+        super().__init__(seed)
         self.grid = None
         self.debug_grid = None
-        self.randomizer = random.Random(seed)
-        self.cols = 10
-        self.rows = 20
         self.locked_positions = {}
+        self.locked_history = [None] * len(self.history)
         self.create_grid(self.locked_positions)
         self.change_piece = False
-        self.run = True
-        self.current_piece = self.get_shape()
-        self.next_pieces = [self.get_shape()
-                            for _ in range(5)]  # next 5 pieces
         self.player = None
         self.fall_time = 0
         self.level_time = 0
         self.fall_speed = 0.27
-        self.score = 0
-        self.piece_dropped = False
-        self.accepted_positions = None
         # self.seed = seed  # save seed
         # random.seed(seed)  # set random seed
-        self.history = []  # keep track of the history
 
     def update(self, win, update_time):
         """
@@ -114,7 +98,6 @@ class Game:
         #     if self.fall_speed > 0.15:
         #         self.fall_speed -= 0.005
 
-        self.update_valid_positions()
         self.player.update(update_time)
 
         if self.piece_dropped:
@@ -143,42 +126,37 @@ class Game:
             self.update_piece(shape_pos, True)
             self.change_piece = False
 
-
-        self.update_valid_positions()
-
         self.draw_window(win)
         self.draw_next_shapes(self.next_pieces, win)  # show next 5 pieces
         pygame.display.update()
 
         # Check if user lost
-        if self.check_lost(self.locked_positions):
+        if self.check_lost():
             self.run = False
 
     def update_piece(self,shape_pos, generate_new_piece = False):
         """
-        Locks the current piece's position on the grid and optionally generates a new piece.
+        Records the colors of the current piece and locks it on the grid.
 
         Args:
             shape_pos (list): The positions of the piece to lock on the grid.
             generate_new_piece (bool): Whether to generate a new piece after locking the current one.
+
+        Returns:
+            tuple: The indices of the rows the piece cleared.
         """
         for pos in shape_pos:
             p = (pos[0], pos[1])
             self.locked_positions[p] = self.current_piece.color
-        self.current_piece = self.next_pieces.pop(
-            0)  # take next from next_pieces
-        if generate_new_piece:
-            self.next_pieces.append(
-                self.get_shape())  # add a new piece into next_pieces
-
-        # call four times to check for multiple clear rows
-        if self.clear_rows(self.grid, self.locked_positions):
-            self.score += 10
+        return super().update_piece(shape_pos, generate_new_piece)
 
     def create_grid(self, locked_positions=None):
         """
         Creates a grid based on the current locked positions.
 
+        Only cells that are occupied on the board are colored, so colors left
+        behind by undone moves are never drawn.
+
         Args:
             locked_positions (dict): A dictionary of positions and colors representing locked pieces.
 
@@ -191,83 +169,11 @@ class Game:
 
         for i in range(len(grid)):
             for j in range(len(grid[i])):
-                if (j, i) in locked_positions:
+                if (j, i) in locked_positions and self.board[i] >> j & 1:
                     c = locked_positions[(j, i)]
                     grid[i][j] = c
         return grid
 
-    def convert_shape_format(self, shape: Piece):
-        """
-        Converts the shape's format to a list of grid positions.
-
-        Args:
-            shape (Piece): The piece to convert.
-
-        Returns:
-            list: A list of tuples representing the positions of the shape on the grid.
-        """
-        positions = Piece.formats[(shape.shape[0],shape.rotation)].copy()
-        for i, pos in enumerate(positions):
-            positions[i] = (pos[0] + shape.x - 2, pos[1] + shape.y - 4)
-
-        # print(f"Converted shape positions: {positions}")  # debug print
-        return positions
-
-    def update_valid_positions(self):
-        """
-        Updates the accepted positions on the grid based on locked positions.
-        """
-        self.accepted_positions = np.ones((self.cols,self.rows), dtype=bool)
-        for i in self.locked_positions:
-            self.accepted_positions[i[0],i[1]] = False
-
-    def valid_space(self, shape: Piece):
-        """
-        Checks if the current piece is in a valid position on the grid.
-
-        Args:
-            shape (Piece): The piece to check.
-
-        Returns:
-            bool: True if the piece is in a valid position, False otherwise.
-        """
-        formatted = self.convert_shape_format(shape)
-        # print(f"Formatted positions: {formatted}")
-        # print(f"Accepted positions: {self.accepted_positions}")
-
-        for pos in formatted:
-            if pos[0] < 0 or pos[0] >= self.cols or pos[1] >= self.rows:
-                return False
-            elif pos[1] > 0 and not self.accepted_positions[pos[0],pos[1]]:
-                return False
-
-        return True
-
-    def check_lost(self, positions):
-        """
-        Checks if the player has lost the game.
-
-        Args:
-            positions (dict): The locked positions on the grid.
-
-        Returns:
-            bool: True if the game is lost, False otherwise.
-        """
-        for pos in positions:
-            x, y = pos
-            if y < 1:
-                return True
-        return False
-
-    def get_shape(self):
-        """
-        Returns a new random piece.
-
-        Returns:
-            Piece: A new randomly generated piece.
-        """
-        return Piece.Piece(5, 0, Piece.shape_list[self.randomizer.randint(0,len(Piece.shapes)-1)])
-
     def draw_grid(self, surface, row, col):
         """
         Draws the grid lines on the game surface.
@@ -288,46 +194,101 @@ class Game:
                     surface, (128, 128, 128), (sx + j * 30, sy),
                     (sx + j * 30, sy + play_height))  # vertical lines
 
-    def clear_rows(self, grid, locked):
+    def push(self, x, y, rotation):
         """
-        Clears any full rows from the grid and shifts down the rows above.
+        Places the current piece like `Engine.push`, and remembers the colors of the
+        piece's cells and of the rows it clears so `pop` can put them back.
 
         Args:
-            grid (list): The current game grid.
-            locked (dict): The locked positions on the grid.
+            x (int): The x-coordinate of the piece.
+            y (int): The y-coordinate of the piece.
+            rotation (int): The rotation state of the piece.
+
+        Returns:
+            bool: True if the player has lost after the move, False otherwise.
+        """
+        # the record of this move goes to the slot after the newest one
+        index = (self.history_start + self.history_size) % len(self.history)
+        locked_positions = self.locked_positions
+        name = self.current_piece.shape[0]
+        cells = [(px + x - 2, py + y - 4) for px, py in Piece.formats[(name, rotation)]]
+        colors = {cell: locked_positions[cell] for cell in cells if cell in locked_positions}
+        board = self.board
+        for dy, mask in self.piece_masks[(name, rotation)][x + 2]:
+            row = y + dy
+            if row >= 0 and board[row] | mask == self.full_row:
+                # the row is about to be cleared along with its colors
+                for col in range(self.cols):
+                    if (col, row) in locked_positions:
+                        colors[(col, row)] = locked_positions[(col, row)]
+        lost = super().push(x, y, rotation)
+        self.locked_history[index] = (cells, colors)
+        return lost
+
+    def pop(self):
+        """
+        Reverts the previous move like `Engine.pop`, along with the colors of the
+        locked positions.
 
         Returns:
-            int: The number of rows cleared.
+            Game: The game instance after undoing the last move.
         """
-        # need to see if row is clear the shift every other row above down one
-
-        inc = 0
-        ind = 0
-        for i in range(len(grid) - 1, -1, -1):
-            row = grid[i]
-            if (0, 0, 0) not in row:
-                inc += 1
-                # add positions to remove from locked
-                ind = i
-                for j in range(len(row)):
-                    try:
-                        del locked[(j, i)]
-                    except:
-                        continue
-        if inc > 0:
-            for key in sorted(list(locked), key=lambda x: x[1])[::-1]:
-                x, y = key
-                if y < ind:
-                    newKey = (x, y + inc)
-                    locked[newKey] = locked.pop(key)
-            if inc == 1:
-                self.score += 10
-            elif inc == 2:
-                self.score += 25
-            elif inc == 3:
-                self.score += 45
-            elif inc == 4:
-                self.score += 70
+        if self.history_size:
+            index = (self.history_start + self.history_size - 1) % len(self.history)
+            cells, colors = self.locked_history[index]
+            self.locked_history[index] = None
+            locked_positions = self.locked_positions
+            cleared = self.history[index].cleared
+            if cleared:
+                # lift the rows that sank back over the cleared ones, see `clear_rows`
+                count = len(cleared)
+                kept = [y for y in range(self.rows) if y not in cleared]
+                locked_positions = self.locked_positions = {
+                    (x, y - count if y < count else kept[y - count]): color
+                    for (x, y), color in locked_positions.items()}
+            for cell in cells:
+                locked_positions.pop(cell, None)
+            locked_positions.update(colors)
+        return super().pop()
+
+    def restore(self, snapshot):
+        """
+        Resets this game in place like `Engine.restore`, and rebuilds the colors of
+        the locked positions from the restored board. Occupied cells keep their
+        current color if they have one and get `locked_color` otherwise.
+
+        Args:
+            snapshot (tuple): A state returned by `snapshot`.
+        """
+        super().restore(snapshot)
+        locked_positions = self.locked_positions
+        self.locked_positions = {
+            (x, y): locked_positions.get((x, y), locked_color)
+            for y, row in enumerate(self.board) for x in range(self.cols) if row >> x & 1}
+        self.locked_history[:] = [None] * len(self.locked_history)
+
+    def clear_rows(self):
+        """
+        Clears any full rows from the board and shifts down the colors of the
+        rows above along with it, in a single pass over the locked colors.
+
+        Returns:
+            tuple: The indices of the cleared rows before clearing, from top to bottom.
+        """
+        cleared = super().clear_rows()
+        if cleared:
+            # every remaining row sinks by the number of cleared rows below it
+            shift = [0] * self.rows
+            count = len(cleared)
+            for y in range(self.rows):
+                while count and cleared[len(cleared) - count] <= y:
+                    count -= 1
+                shift[y] = count
+            self.locked_positions = {
+                (x, y + (shift[y] if y >= 0 else len(cleared))): color
+                for (x, y), color in self.locked_positions.items()
+                if y not in cleared}
+        return cleared
 
     def draw_next_shapes(self, shapes, surface):
         """
@@ -394,122 +355,13 @@ class Game:
         # pygame.display.update()
         draw_text(f"score: {self.score}", 20, (255, 255, 255), surface, 20, 20)
 
-    def move_left(self):
-        """
-        Moves the current piece one position to the left if possible.
-        """
-        self.current_piece.x -= 1
-        if not self.valid_space(self.current_piece):
-            self.current_piece.x += 1
-
-    def move_right(self):
-        """
-        Moves the current piece one position to the right if possible.
-        """
-        self.current_piece.x += 1
-        if not self.valid_space(self.current_piece):
-            self.current_piece.x -= 1
-
-    def rotate_piece(self):
-        """
-        Rotates the current piece clockwise if the new position is valid.
-        """
-        self.current_piece.rotation = (self.current_piece.rotation + 1) % len(
-            self.current_piece.shape[1])
-        if not self.valid_space(self.current_piece):
-            self.current_piece.rotation = self.current_piece.rotation - 1 % len(
-                self.current_piece.shape[1])
-
-    def drop_piece(self):
-        """
-        Drops the current piece by one position if possible.
-        """
-        self.current_piece.y += 1
-        if not self.valid_space(self.current_piece):
-            self.current_piece.y -= 1
-        else:
-            self.piece_dropped = True
-
-    def push(self, x, y, rotation):
-        """
-        Places the current piece on the grid and updates the game state.
-
-        Args:
-            x (int): The x-coordinate of the piece.
-            y (int): The y-coordinate of the piece.
-            rotation (int): The rotation state of the piece.
-
-        Returns:
-            bool: True if the player has lost after the move, False otherwise.
-        """
-        self.history.append({
-            'locked_positions':
-            self.locked_positions.copy(),
-            'current_piece': (self.current_piece.x, self.current_piece.y, self.current_piece.shape,
-                              self.current_piece.rotation)
-        })
-        shape_pos = self.convert_shape_format(Piece.Piece(x,y,self.current_piece.shape,rotation))
-
-        # Add the piece to the grid
-        self.update_piece(shape_pos)
-        if not self.next_pieces:
-            self.next_pieces.append(self.get_shape())
-        self.update_valid_positions()
-        # self.create_grid(self.locked_positions)
-        return self.check_lost(self.locked_positions)
-
-    def pop(self):
-        """
-        Reverts the game state to the previous move.
-
-        Returns:
-            Game: The game instance after undoing the last move.
-        """
-        if not self.history:
-            return self  # no action to undo
-
-        # restore the previous state
-        last_state = self.history.pop()
-        self.locked_positions = last_state['locked_positions']
-
-        self.next_pieces.insert(0,self.current_piece.copy())
-
-        self.current_piece.x, self.current_piece.y,self.current_piece.shape, self.current_piece.rotation = last_state[
-            'current_piece']
-        # self.grid = self.create_grid(self.locked_positions)
-        self.update_valid_positions()
-
-        return self
-
     def quit(self):
         """
         Stops the game and quits the Pygame display.
         """
-        self.run = False
+        super().quit()
         pygame.display.quit()
 
-    def copy(self):
-        """
-        Creates a copy of the current game state.
-
-        Returns:
-            Game: A new Game instance with the same state as the current game.
-        """
-        # create a new Game
-        new_game = Game(0)
-
-        # copy all we need
-        new_game.grid = [row[:] for row in self.grid]
-        new_game.current_piece = self.current_piece.copy()
-        new_game.next_pieces = [piece.copy() for piece in self.next_pieces]
-        new_game.score = self.score
-        new_game.run = self.run
-        new_game.locked_positions = self.locked_positions.copy()
-        new_game.create_grid(new_game.locked_positions)
-        new_game.update_valid_positions()
-
-        return new_game
-
     # def lock_piece(self):
     #     shape_pos = self.convert_shape_format(self.current_piece)
     #     # lock current piece's position to locked_positions
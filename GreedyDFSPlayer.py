@@ -1,74 +1,373 @@
-import Game
-from AIPlayerBase import AIPlayerBase
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from AIPlayerBase import AIPlayerBase, SearchTimeout, get_worker_player
+
+
+def search_root_chunk(snapshot, moves, depth, prune, deadline=None):
+    """
+    Searches a share of the root moves in a pool worker.
+
+    Args:
+        snapshot (tuple): The game state to search from, see `Engine.snapshot`.
+        moves (list): (index, (x, y, rotation)) pairs of the root moves to search.
+        depth (int): The depth of the search tree.
+        prune (bool): Whether to prune with `upper_bound`.
+        deadline (float): The `time.monotonic()` time to give up at, or None.
+
+    Returns:
+        tuple: The result of `search_root`, followed by the nodes searched and pruned,
+            or None if the deadline passed or the search was cancelled first.
+    """
+    player = get_worker_player()
+    player.game.restore(snapshot)
+    player.prune = prune
+    player.deadline = deadline
+    player.nodes_searched = 0
+    player.nodes_pruned = 0
+    try:
+        result = player.search_root(player.game, moves, depth)
+    except SearchTimeout:
+        return None
+    return result + (player.nodes_searched, player.nodes_pruned)
 
 
 class GreedyDFSPlayer(AIPlayerBase):
 
-    def __init__(self, name, game, depth=2):
+    def __init__(self, name, game, depth=2, prune=False, table_size=0, workers=0,
+                 time_budget=None):
         """
         Initializes a GreedyDFSPlayer with the given name, game, and search depth.
 
         Args:
             name (str): The name of the player.
-            game (Game): The game instance that the player is interacting with.
-            depth (int): The depth of the search tree. Defaults to 2.
+            game (Engine): The game instance that the player is interacting with.
+            depth (int): The depth of the search tree, or the deepest depth tried when
+                there is a time budget. Defaults to 2.
+            prune (bool): Whether to skip subtrees whose `upper_bound` cannot beat the
+                best evaluation found so far. The chosen move is the same either way.
+                Defaults to False.
+            table_size (int): The number of searched nodes remembered in the transposition
+                table. It only hits when several move orders of one search reach the same
+                board, since depth is part of the key and a board searched again on the
+                next move has one more level left. 0 disables the table. Defaults to 0.
+            workers (int): The number of worker processes the root moves are split across.
+                The pool is started on the first decision and kept until `close`. 0 or 1
+                searches in this process. Defaults to 0.
+            time_budget (float): The wall-clock time of a decision in milliseconds. The
+                search deepens one level at a time from depth 0 and plays the move of
+                the deepest level completed before the deadline. Depth 0 always
+                completes. None searches `depth` in full. Defaults to None.
         """
         super().__init__(name, game)
         self.depth = depth
+        self.prune = prune
+        self.nodes_searched = 0  # placements evaluated or expanded by the last search
+        self.nodes_pruned = 0  # subtrees skipped by the last search
+        self.table_size = table_size
+        # (board hash, piece names, depth) -> (value - 6 * score, exact, best sequence), least recent first
+        self.table = OrderedDict()
+        self.table_hits = 0
+        self.table_misses = 0
+        self.table_evictions = 0
+        self.workers = workers
+        self.time_budget = time_budget
+        self.deadline = None  # time.monotonic() time the running search gives up at
+        self.last_depth = None  # depth of the last decision's move
+
+    def upper_bound(self, game, depth):
+        """
+        Returns an evaluation that no leaf reached from this state within `depth`
+        more placements can exceed.
+
+        `evaluate_state` never exceeds 6 * score - sum(heights) - 25 * holes, because
+        the bumpiness outweighs the edge wells. The bound assumes the placed cells
+        complete the emptiest rows first, that the cleared rows are scored as tetrises,
+        that the heights shrink to the number of cells left on the board, and that
+        every placed cell or cleared row removes a hole. A game lost on the way is a
+        leaf too, so every number of placements up to `depth` is considered.
 
-    def greedy_dfs(self, game, depth, state):
+        Args:
+            game (Engine): The game instance being evaluated.
+            depth (int): The number of placements left in the search.
+
+        Returns:
+            int: The optimistic evaluation.
+        """
+        empties = sorted(game.cols - fill for fill in game.row_fills)
+        cells = sum(game.row_fills)
+        holes = sum(game.column_holes)
+        best = float('-inf')
+        cleared = 0
+        filled = 0
+        for placed in range(depth + 1):
+            while True:
+                need = empties[cleared] if cleared < len(empties) else game.cols
+                if filled + need > 4 * placed:
+                    break
+                filled += need
+                cleared += 1
+            gain = (cleared // 4) * 70 + (0, 10, 25, 45)[cleared % 4]
+            # the last piece may lock above the grid when it loses the game
+            heights = max(0, cells + 4 * max(0, placed - 1) - game.cols * cleared)
+            holes_left = max(0, holes - 4 * placed - game.cols * cleared)
+            best = max(best, 6 * (game.score + gain) - heights - 25 * holes_left)
+        return best
+
+    def greedy_dfs(self, game, depth, state, alpha=float('-inf')):
         """
         Executes the Greedy DFS algorithm to determine the best move.
 
         Args:
-            game (Game): The game instance being evaluated.
+            game (Engine): The game instance being evaluated.
             depth (int): The current depth in the search tree.
             state (tuple): The current state of the game (x, y, rotation).
+            alpha (float): The best evaluation found elsewhere in the search. With
+                pruning on, the result is exact only when it is above `alpha`.
 
         Returns:
             tuple: A tuple containing the evaluation score and the sequence of moves leading to that score.
         """
-        if depth == 0 or game.check_lost(game.locked_positions):
+        if depth == 0 or game.check_lost():
             return self.evaluate_state(game), [state]
+        if not self.table_size:
+            return self.expand(game, depth, state, alpha)
+
+        # the same board may be reached by several move orders; the current piece
+        # has just spawned, so its name is all that sets it apart
+        key = (game.board_hash,
+               (game.current_piece.shape[0],)
+               + tuple(next_piece.shape[0] for next_piece in game.next_pieces[:depth - 1]),
+               depth)
+        entry = self.table.get(key)
+        if entry is not None:
+            # leaf scores grow with 6 * score, so entries are stored relative to it
+            value = entry[0] + 6 * game.score
+            if entry[1] or value <= alpha:
+                self.table.move_to_end(key)
+                self.table_hits += 1
+                return value, [state] + entry[2]
+        self.table_misses += 1
+
+        value, sequence = self.expand(game, depth, state, alpha)
+        # a value at or below alpha may have been cut short, so only alpha bounds it
+        exact = not self.prune or value > alpha
+        self.table[key] = ((value if exact else alpha) - 6 * game.score, exact, sequence[1:])
+        self.table.move_to_end(key)
+        if len(self.table) > self.table_size:
+            self.table.popitem(last=False)
+            self.table_evictions += 1
+        return value, sequence
+
+    def expand(self, game, depth, state, alpha):
+        """
+        Searches the children of a node of the Greedy DFS, see `greedy_dfs`.
+
+        Args:
+            game (Engine): The game instance being evaluated.
+            depth (int): The current depth in the search tree, at least 1.
+            state (tuple): The current state of the game (x, y, rotation).
+            alpha (float): The best evaluation found elsewhere in the search.
+
+        Returns:
+            tuple: A tuple containing the evaluation score and the sequence of moves leading to that score.
+        """
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise SearchTimeout()
+        self.check_cancelled()
+
+        possible_states = self.get_possible_states(game)
+        if depth == 1 and possible_states:
+            # every child is a leaf, so score them all in one batch
+            evals = self.evaluate_children(game, possible_states)
+            best = int(np.argmax(evals))
+            return int(evals[best]), [state, possible_states[best]]
+
+        if self.prune and possible_states:
+            # try the statically best children first so the bound cuts sooner
+            order = np.argsort(-self.evaluate_children(game, possible_states), kind='stable')
+            possible_states = [possible_states[i] for i in order]
 
         max_eval = float('-inf')
         best_move = []
-        for x, y, rotation in self.get_possible_states(game):
+        for x, y, rotation in possible_states:
             game.push(x, y, rotation)
-            eval, sequence = self.greedy_dfs(game, depth - 1, (x, y, rotation))
+            if self.prune and self.upper_bound(game, depth - 1) <= max(alpha, max_eval):
+                self.nodes_pruned += 1
+                game.pop()
+                continue
+            self.nodes_searched += 1
+            eval, sequence = self.greedy_dfs(game, depth - 1, (x, y, rotation), max(alpha, max_eval))
             game.pop()
             if eval > max_eval:
                 max_eval = eval
                 best_move = sequence
         return max_eval, [state] + best_move
 
-    def generate_command(self):
+    def evaluate_children(self, game, possible_states):
         """
-        Generates the best move for the AI player using the Greedy DFS algorithm.
+        Evaluates every placement of the current piece in one batch.
 
-        Determines the optimal move based on the current state of the game and the predefined depth.
-        Updates the player's choice with the best move and places the current piece accordingly.
+        Args:
+            game (Engine): The game instance being evaluated. It is left unchanged.
+            possible_states (list): The placements (x, y, rotation) to evaluate.
+
+        Returns:
+            np.ndarray: The evaluation of the game after each placement.
         """
-        best_score = float('-inf')
-        best_move = None
+        boards = []
+        scores = []
+        for x, y, rotation in possible_states:
+            game.push(x, y, rotation)
+            boards.append(game.board[:])
+            scores.append(game.score)
+            game.pop()
+        self.nodes_searched += len(possible_states)
+        return self.evaluate_batch(np.array(boards), scores)
 
-        possible_states = self.get_possible_states(self.game)
-        mock_game = self.game.copy()
+    def table_stats(self):
+        """
+        Returns the transposition table statistics, accumulated since the player was created.
+
+        Returns:
+            dict: The number of entries, the table size, the hits, misses and evictions,
+                and the hit rate.
+        """
+        lookups = self.table_hits + self.table_misses
+        return {'entries': len(self.table), 'size': self.table_size,
+                'hits': self.table_hits, 'misses': self.table_misses,
+                'evictions': self.table_evictions,
+                'hit_rate': self.table_hits / lookups if lookups else 0.0}
+
+    def search_root(self, game, moves, depth):
+        """
+        Searches root moves in order and keeps the first one with the best evaluation.
+
+        Args:
+            game (Engine): The game to search from. It is left unchanged, unless the
+                search raises `SearchTimeout`.
+            moves (list): (index, (x, y, rotation)) pairs of the root moves, in index order.
+            depth (int): The depth of the search tree below the root moves.
+
+        Returns:
+            tuple: The best evaluation, the index of the first move reaching it (None when
+                no move was searched) and the sequence of moves leading to it.
+        """
+        best_score = float('-inf')
+        best_index = None
         best_sequence = []
-        for state in possible_states:
-            mock_game.push(state[0], state[1], state[2])
-            score, sequence = self.greedy_dfs(mock_game, self.depth, state)
-            mock_game.pop()
+        for index, state in moves:
+            game.push(state[0], state[1], state[2])
+            if self.prune and depth > 0 and self.upper_bound(game, depth) <= best_score:
+                self.nodes_pruned += 1
+                game.pop()
+                continue
+            self.nodes_searched += 1
+            score, sequence = self.greedy_dfs(game, depth, state, best_score)
+            game.pop()
 
             if score > best_score:
                 best_score = score
-                best_move = state
+                best_index = index
                 best_sequence = sequence
+        return best_score, best_index, best_sequence
+
+    def search_root_in_pool(self, game, moves, depth):
+        """
+        Splits the root moves across the worker pool and merges the results.
 
-        if best_move:
-            self.choice = best_move
-            self.place_current_piece(best_move)
-            self.placing_piece = True
+        Every worker gets an interleaved share of the moves, restores the game from a
+        snapshot and runs `search_root` on it. The best result wins and ties go to the
+        lowest index, as in the serial search.
+
+        Args:
+            game (Engine): The game to search from.
+            moves (list): (index, (x, y, rotation)) pairs of the root moves, in index order.
+            depth (int): The depth of the search tree below the root moves.
+
+        Returns:
+            tuple: The best evaluation, the index of the first move reaching it (None when
+                no move was searched) and the sequence of moves leading to it.
+
+        Raises:
+            SearchTimeout: If a worker did not finish before `deadline` or the search
+                was cancelled.
+        """
+        self.get_pool(self.workers, table_size=self.table_size)
+        snapshot = game.snapshot()
+        chunks = [moves[k::self.workers] for k in range(min(self.workers, len(moves)))]
+        results = self.run_in_pool(search_root_chunk,
+                                   [(snapshot, chunk, depth, self.prune, self.deadline)
+                                    for chunk in chunks])
+        if None in results:
+            raise SearchTimeout()
+        best = (float('-inf'), None, [])
+        for score, index, sequence, searched, pruned in results:
+            self.nodes_searched += searched
+            self.nodes_pruned += pruned
+            if index is not None and (best[1] is None or score > best[0]
+                                      or (score == best[0] and index < best[1])):
+                best = (score, index, sequence)
+        return best
+
+    def search_depth(self, game, moves, depth):
+        """
+        Searches all root moves to one depth, in the worker pool when there is one.
+
+        Args:
+            game (Engine): The game to search from. It is left unchanged.
+            moves (list): (index, (x, y, rotation)) pairs of the root moves, in index order.
+            depth (int): The depth of the search tree below the root moves.
+
+        Returns:
+            tuple: The index of the first move with the best evaluation (None when no
+                move was searched) and the sequence of moves leading to it.
+
+        Raises:
+            SearchTimeout: If `deadline` passed during the search or it was cancelled.
+        """
+        if self.workers > 1 and depth > 0 and len(moves) > 1:
+            _, best_index, best_sequence = self.search_root_in_pool(game, moves, depth)
+        else:
+            _, best_index, best_sequence = self.search_root(game.copy(), moves, depth)
+        return best_index, best_sequence
+
+    def choose_move(self, game):
+        """
+        Chooses the best move for the current piece using the Greedy DFS algorithm.
+
+        Args:
+            game (Engine): The game to choose a move in.
+
+        Returns:
+            tuple: The placement (x, y, rotation) with the best evaluation at the predefined
+                depth, or None if there is none.
+        """
+        self.nodes_searched = 0
+        self.nodes_pruned = 0
+        possible_states = self.get_possible_states(game)
+        moves = list(enumerate(possible_states))
+        if self.time_budget is None:
+            best_index, _ = self.search_depth(game, moves, self.depth)
+            self.last_depth = self.depth
+        else:
+            # iterative deepening: keep the move of the deepest completed level
+            deadline = time.monotonic() + self.time_budget / 1000
+            best_index = None
+            for depth in range(self.depth + 1):
+                self.deadline = deadline if depth > 0 else None
+                try:
+                    best_index, _ = self.search_depth(game, moves, depth)
+                except SearchTimeout:
+                    break
+                finally:
+                    self.deadline = None
+                self.last_depth = depth
+                if time.monotonic() >= deadline:
+                    break
+        return possible_states[best_index] if best_index is not None else None
 
     def update(self, update_time):
         """
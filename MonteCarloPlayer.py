@@ -1,26 +1,239 @@
-import pygame.event
-
-import Game
-from AIPlayerBase import AIPlayerBase
-from Piece import Piece
+from Engine import Engine
+from AIPlayerBase import AIPlayerBase, SearchTimeout, get_worker_player
+from Piece import shape_list
+from Rollout import Rollout
+from VectorEngine import build_placement_tables, score_table
 import random
-from collections import defaultdict
+import time
+
+import numpy as np
+
+
+def search_tree(snapshot, simulations, time_budget, seed):
+    """
+    Grows an independent search tree in a pool worker, for root parallelism.
+
+    Args:
+        snapshot (tuple): The game state to search from, see `Engine.snapshot`.
+        simulations (int): The number of simulations to run.
+        time_budget (float): The time to search for in milliseconds, or None.
+        seed (int): The seed of the worker's random number generator.
+
+    Returns:
+        tuple: The moves, visits and value sums of the root children, and the
+            number of simulations run, or None if the search was cancelled.
+    """
+    player = get_worker_player()
+    player.game.restore(snapshot)
+    player.simulations = simulations
+    player.time_budget = time_budget
+    player.randomizer = random.Random(seed)
+    player.tree = NodePool()
+    try:
+        player.mcts(player.game, None)
+    except SearchTimeout:
+        return None
+    children = player.tree.children(0)
+    return (player.tree.move[children.start:children.stop].tolist(),
+            player.tree.visits[children.start:children.stop].tolist(),
+            player.tree.value_sum[children.start:children.stop].tolist(),
+            player.last_simulations)
+
+
+def play_rollouts(leaves, depth):
+    """
+    Plays rollouts from selected leaves in a pool worker, for leaf parallelism.
+
+    Args:
+        leaves (list): (snapshot, seed) pairs, one per rollout.
+        depth (int): The maximum number of pieces placed by each rollout.
+
+    Returns:
+        list: The rewards of every rollout, see `Rollout.play`.
+    """
+    player = get_worker_player()
+    results = []
+    for snapshot, seed in leaves:
+        player.game.restore(snapshot)
+        results.append(player.rollout.play(player.game, depth, player.evaluate_state,
+                                           random.Random(seed)))
+    return results
+
+
+class NodePool:
+    """
+    The nodes of a Monte Carlo search tree, stored in parallel numpy arrays.
+
+    A node stands for the game after the moves on the path from the root. The
+    children of a node are allocated next to each other, so a node only keeps
+    the index of its first child and their number. A node costs 29 bytes.
+
+    Attributes:
+        size (int): The number of nodes in use. Node 0 is the root.
+        visits (np.ndarray): The number of simulations through every node.
+        value_sum (np.ndarray): The sum of the simulation scores of every node.
+        parent (np.ndarray): The index of the parent of every node, -1 for the root.
+        first_child (np.ndarray): The index of the first child, -1 while the node is not expanded.
+        num_children (np.ndarray): The number of children of every expanded node.
+        move (np.ndarray): The placement (x, y, rotation) leading to every node.
+        prior (np.ndarray): The static evaluation of every node relative to the best of
+            its siblings, 0 for the best and negative for the others.
+    """
+
+    def __init__(self, capacity=1024):
+        """
+        Initializes a pool holding only an unexpanded root.
+
+        Args:
+            capacity (int): The number of nodes allocated up front. The arrays
+                double in size when they run out.
+        """
+        self.size = 0
+        self.visits = np.zeros(capacity, dtype=np.int32)
+        self.value_sum = np.zeros(capacity, dtype=np.float64)
+        self.parent = np.zeros(capacity, dtype=np.int32)
+        self.first_child = np.zeros(capacity, dtype=np.int32)
+        self.num_children = np.zeros(capacity, dtype=np.int16)
+        self.move = np.zeros((capacity, 3), dtype=np.int8)
+        self.prior = np.zeros(capacity, dtype=np.float32)
+        self.allocate(-1, [(0, 0, 0)])
+
+    def allocate(self, parent, moves):
+        """
+        Appends unexpanded, unvisited nodes.
+
+        Args:
+            parent (int): The index of the parent of the new nodes.
+            moves (list): The placement (x, y, rotation) leading to each new node.
+
+        Returns:
+            int: The index of the first new node.
+        """
+        first = self.size
+        self.size += len(moves)
+        if self.size > len(self.visits):
+            capacity = max(self.size, 2 * len(self.visits))
+            for name in ('visits', 'value_sum', 'parent', 'first_child', 'num_children', 'move',
+                         'prior'):
+                array = getattr(self, name)
+                grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+                grown[:first] = array[:first]
+                setattr(self, name, grown)
+        self.visits[first:self.size] = 0
+        self.value_sum[first:self.size] = 0
+        self.parent[first:self.size] = parent
+        self.first_child[first:self.size] = -1
+        self.num_children[first:self.size] = 0
+        self.prior[first:self.size] = 0
+        if moves:
+            self.move[first:self.size] = moves
+        return first
+
+    def expand(self, node, moves, priors=None):
+        """
+        Adds the children of a node.
+
+        Args:
+            node (int): The index of the node.
+            moves (list): The placements (x, y, rotation) available at the node.
+                An empty list marks the node as terminal.
+            priors (list): The prior of every child, see `prior`. Defaults to 0 for all.
+        """
+        first = self.first_child[node] = self.allocate(node, moves)
+        self.num_children[node] = len(moves)
+        if priors is not None:
+            self.prior[first:first + len(moves)] = priors
+
+    def children(self, node):
+        """
+        Returns the indices of the children of a node.
+
+        Args:
+            node (int): The index of the node.
+
+        Returns:
+            range: The indices of the children.
+        """
+        first = self.first_child[node]
+        return range(first, first + self.num_children[node])
+
+    def subtree(self, node):
+        """
+        Copies the subtree below a node into a new pool, with the node as its root.
+
+        Args:
+            node (int): The index of the new root.
+
+        Returns:
+            NodePool: The new pool.
+        """
+        pool = NodePool(max(1024, len(self.visits)))
+        pool.visits[0] = self.visits[node]
+        pool.value_sum[0] = self.value_sum[node]
+        pool.move[0] = self.move[node]
+        queue = [(node, 0)]
+        while queue:
+            old, new = queue.pop()
+            if self.first_child[old] < 0:
+                continue
+            children = self.children(old)
+            pool.expand(new, self.move[children.start:children.stop].tolist(),
+                        self.prior[children.start:children.stop])
+            first = pool.first_child[new]
+            pool.visits[first:first + len(children)] = self.visits[children.start:children.stop]
+            pool.value_sum[first:first + len(children)] = self.value_sum[children.start:children.stop]
+            queue.extend(zip(children, range(first, first + len(children))))
+        return pool
 
 
 class MonteCarloPlayer(AIPlayerBase):
 
-    def __init__(self, name, game, simulations=100):
+    def __init__(self, name, game, simulations=100, time_budget=None, seed=None, workers=0,
+                 parallel='root'):
         """
         Initializes a MonteCarloPlayer with the given name, game instance, and number of simulations.
 
         Args:
             name (str): The name of the player.
-            game (Game): The game instance that the player is interacting with.
+            game (Engine): The game instance that the player is interacting with.
             simulations (int): The number of simulations to run for each move decision.
+            time_budget (float): The wall-clock time of a decision in milliseconds. When set,
+                simulations run until the deadline instead of `simulations` times, and at
+                least one runs. Defaults to None.
+            seed (int): The seed of the random number generator used by the search. With a
+                fixed seed and no time budget, the same game state gives the same move.
+                None seeds it from the system. Defaults to None.
+            workers (int): The number of worker processes to search with. 0 or 1 searches
+                in this process. Defaults to 0.
+            parallel (str): How the workers share a decision. 'root' grows an independent
+                tree per worker and merges the visit counts of the root children. 'leaf'
+                grows one tree here, selects a batch of leaves with virtual loss and plays
+                their rollouts in the workers. Defaults to 'root'.
         """
         super().__init__(name, game)
         self.simulations = simulations  # Number of simulations per move
-        self.tree = defaultdict(lambda: {"score": 0, "visits": 0, "children": {}})
+        self.simulation_depth = 20  # placements scored after every node, played out by the rollout
+        self.tree_depth = 6  # placements in the tree: the current piece and the preview
+        self.time_budget = time_budget
+        self.last_simulations = 0  # simulations run for the last decision
+        self.nodes_searched = 0  # nodes added to the tree by the last decision
+        self.simulated_game = None  # reused by every simulation
+        self.rollout = Rollout(game.cols)
+        self.placement_tables = build_placement_tables(game.cols)
+        self.shape_index = {name: i for i, (name, _) in enumerate(shape_list)}
+        self.tree = None  # NodePool of the last search
+        self.tree_key = None  # game state key the root of `tree` stands for
+        self.reused_visits = 0  # visits the last search inherited from the previous one
+        self.randomizer = random.Random(seed)
+        self.workers = workers
+        self.parallel = parallel
+        self.virtual_loss = -20000  # counted per rollout in flight, as if it lost
+        self.batch_size = 4  # leaves selected per worker and batch in leaf parallelism
+        # progressive widening: a node with n visits admits its
+        # widening_constant * (n + 1) ** widening_exponent children with the best priors
+        self.widening_constant = 1
+        self.widening_exponent = 0.5
+        self.prior_weight = 300  # weight of the prior in `uct_value`, fading with visits
 
     def update(self, update_time):
         """
@@ -31,206 +244,389 @@ class MonteCarloPlayer(AIPlayerBase):
         """
         super().update(update_time)
 
-    def generate_command(self):
+    def choose_move(self, game):
         """
-        Generates a command by running the Monte Carlo Tree Search (MCTS) algorithm to determine the best move.
+        Chooses a move by running the Monte Carlo Tree Search (MCTS) algorithm.
 
-        Resets the search tree, performs simulations to evaluate possible moves, and sets the chosen move.
-        """
-        self.tree = defaultdict(lambda: {"score": 0, "visits": 0, "children": {}})
-        root_state = self.get_game_state_key(self.game)
-        best_move = self.mcts(root_state)
-        self.placing_piece = True
-        self.choice = best_move
+        The subtree of the previously chosen move is kept as the new root when the
+        game reached the state it predicted; otherwise the search starts from an
+        empty tree. Root parallelism starts from empty trees every time.
 
-    def mcts(self, root_state):
+        Args:
+            game (Engine): The game to choose a move in.
+
+        Returns:
+            tuple: The best move determined by MCTS.
+        """
+        if self.workers > 1 and self.parallel == 'root':
+            self.tree = None
+            return self.search_in_pool(game)
+        root_state = self.get_game_state_key(game)
+        if self.tree is None or self.tree_key != root_state:
+            self.tree = NodePool()
+        self.reused_visits = int(self.tree.visits[0])
+        child = self.mcts(game, root_state)
+        if child is None:
+            self.tree = None
+            return None
+        best_move = tuple(self.tree.move[child].tolist())
+
+        # keep the chosen subtree for the next move
+        predicted = game.clone()
+        if predicted.push(*best_move):
+            self.tree = None
+        else:
+            self.tree = self.tree.subtree(child)
+            self.tree_key = self.get_game_state_key(predicted)
+        return best_move
+
+    def mcts(self, game, root_state):
         """
         Performs the Monte Carlo Tree Search (MCTS) algorithm to find the best move.
 
         Args:
-            root_state (tuple): The current state of the game represented as a tuple.
+            game (Engine): The game to search from.
+            root_state (tuple): The current state of the game, see `get_game_state_key`.
 
         Returns:
-            tuple: The best move determined by MCTS.
+            int: The index of the best child of the root in `tree`, or None if the
+                current piece cannot be placed.
         """
-        self.expand(self.game, root_state)
-        for _ in range(self.simulations):
-            node = self.tree[root_state]
-            # Selection
-            state = self.select(node)
-            # Expansion
-            if state not in self.tree:
-                self.expand(self.game, state)
+        tree = self.tree
+        if tree.first_child[0] < 0:
+            self.expand(game, 0)
+        if not tree.num_children[0]:
+            return None
+        deadline = None
+        if self.time_budget is not None:
+            deadline = time.monotonic() + self.time_budget / 1000
+        self.last_simulations = 0
+        self.nodes_searched = 0
+        snapshot = game.snapshot()
+        while True:
+            if deadline is None and self.last_simulations >= self.simulations:
+                break
+            if deadline is not None and self.last_simulations and time.monotonic() >= deadline:
+                break
+            self.check_cancelled()
+            if self.workers > 1 and self.parallel == 'leaf':
+                count = self.workers * self.batch_size
+                if deadline is None:
+                    count = min(count, self.simulations - self.last_simulations)
+                self.simulate_batch(game, snapshot, count)
+                self.last_simulations += count
+                continue
+            self.last_simulations += 1
+
+            simulated_game = self.restore_simulated_game(game, snapshot)
+            # Selection and expansion
+            path, rewards, lost = self.descend(simulated_game)
             # Simulation
-            score = self.simulate(self.game, state)
+            if not lost:
+                rewards.extend(self.simulate(simulated_game))
             # Backpropagation
-            self.backpropagate(state, score)
-
-        # Choose the best move based on the average score
-        max_score = max(
-            (self.tree[s]["score"] / self.tree[s]["visits"]) if self.tree[s]["visits"] > 0 else 0
-            for s in self.tree[root_state]["children"]
-        )
-        best_states = [
-        s for s in self.tree[root_state]["children"]
-        if ((self.tree[s]["score"] / self.tree[s]["visits"])
-            if self.tree[s]["visits"] > 0 else 0) == max_score
-        ]
-        return random.choice(best_states)
-
-    def select(self, node):
+            self.backpropagate(path[-1], len(path) - 1, rewards)
+
+        # Choose the most visited move, then the one with the best average score
+        children = tree.children(0)
+        visits = tree.visits[children.start:children.stop]
+        means = np.where(visits > 0, tree.value_sum[children.start:children.stop] / np.maximum(visits, 1),
+                         -np.inf)
+        best = (visits == visits.max()) & (means == means[visits == visits.max()].max())
+        best_children = [children.start + i for i in np.flatnonzero(best)]
+        return self.randomizer.choice(best_children)
+
+    def restore_simulated_game(self, game, snapshot):
         """
-        Selects the best child state based on the Upper Confidence Bound for Trees (UCT) value.
+        Resets the reusable simulation game to the state being searched.
 
         Args:
-            node (dict): The node in the tree representing the current state.
+            game (Engine): The game being searched.
+            snapshot (tuple): Its snapshot.
 
         Returns:
-            tuple: The selected state based on UCT.
+            Engine: The simulation game.
         """
-        # Selection using UCT (Upper Confidence Bound for Trees)
-        state = max(node["children"], key=lambda s: self.uct_value(s))
-        return state
-
-    def uct_value(self, state):
+        if self.simulated_game is None:
+            self.simulated_game = game.clone()
+        else:
+            self.simulated_game.restore(snapshot)
+            # count the simulations with the decision being profiled, if any
+            self.simulated_game.call_counter = game.call_counter
+        return self.simulated_game
+
+    def descend(self, game):
         """
-        Computes the Upper Confidence Bound for Trees (UCT) value of a given state.
+        Selects a node from the root down, placing the moves on the way, and expands it
+        if it was visited before.
 
         Args:
-            state (tuple): The state for which to compute the UCT value.
+            game (Engine): The game in the state of the root. It is left in the state of
+                the selected node.
 
         Returns:
-            float: The UCT value of the state.
+            tuple: The indices of the nodes from the root to the selected node, the rewards
+                of the placements on the way (see `simulate`) and whether the game was lost.
         """
-        if self.tree[state]["visits"] == 0:
-            return float('inf')  # Favor unexplored states
-        return (self.tree[state]["score"] / self.tree[state]["visits"]) + \
-            2 * (2 * (self.tree[state]["visits"] ** 0.5) / (1 + self.tree[state]["visits"]))
-
-    def expand(self, game, state):
+        tree = self.tree
+        node = 0
+        path = [0]
+        rewards = []
+        while tree.num_children[node] > 0:
+            node = self.select(node)
+            path.append(node)
+            if game.push(*tree.move[node].tolist()):
+                rewards.append(-20000)
+                return path, rewards, True
+            rewards.append(self.evaluate_state(game) + 4)
+        # a new node is expanded when it is selected again, so nodes that are
+        # only ever simulated once do not pay for the placement search; below
+        # the preview the rollout takes over
+        if tree.first_child[node] < 0 and tree.visits[node] > 0 and len(path) <= self.tree_depth:
+            self.expand(game, node)
+        return path, rewards, False
+
+    def simulate_batch(self, game, snapshot, count):
         """
-        Expands the tree by adding child states for a given state.
+        Runs simulations whose rollouts are played by the worker pool.
+
+        The leaves are selected one after the other. Each selected path is charged a
+        virtual loss, so the next selections spread over other nodes. The virtual
+        losses are taken back when the rollouts are backpropagated, or when the
+        search is cancelled while the workers play them.
 
         Args:
-            game (Game): The current game instance.
-            state (tuple): The state to expand.
-        """
-        possible_states = self.get_possible_states_from_state(game, state)
-        for child_state in possible_states:
-            if child_state not in self.tree:
-                self.tree[state]["children"][child_state] = {"score": 0, "visits": 0, "children": {}}
+            game (Engine): The game being searched.
+            snapshot (tuple): Its snapshot.
+            count (int): The number of simulations.
 
-    def simulate(self, game: Game.Game, state):
+        Raises:
+            SearchTimeout: If the search was cancelled.
         """
-        Simulates a random game from a given state and returns the resulting score.
+        tree = self.tree
+        selected = []
+        leaves = []
+        for _ in range(count):
+            simulated_game = self.restore_simulated_game(game, snapshot)
+            path, rewards, lost = self.descend(simulated_game)
+            tree.visits[path] += 1
+            tree.value_sum[path] += self.virtual_loss
+            selected.append((path, rewards, lost))
+            if not lost:
+                leaves.append((simulated_game.snapshot(), self.randomizer.getrandbits(32)))
+
+        self.get_pool(self.workers)
+        chunks = [leaves[k::self.workers] for k in range(self.workers)]
+        try:
+            results = self.run_in_pool(play_rollouts, [(chunk, self.simulation_depth)
+                                                       for chunk in chunks])
+        finally:
+            for path, _, _ in selected:
+                tree.visits[path] -= 1
+                tree.value_sum[path] -= self.virtual_loss
+        rollouts = [None] * len(leaves)
+        for k, chunk_results in enumerate(results):
+            rollouts[k::self.workers] = chunk_results
+
+        rollouts = iter(rollouts)
+        for path, rewards, lost in selected:
+            if not lost:
+                rewards.extend(next(rollouts))
+            self.backpropagate(path[-1], len(path) - 1, rewards)
+
+    def search_in_pool(self, game):
+        """
+        Chooses a move with root parallelism: every worker grows its own tree with its
+        share of the simulations, and the move whose root child got the most visits in
+        total wins. Ties go to the better average score, then to the first move.
 
         Args:
-            game (Game): The current game instance.
-            state (tuple): The state from which to simulate.
+            game (Engine): The game to choose a move in.
 
         Returns:
-            float: The score obtained from the simulation.
-        """
-        # Create a copy of the game to simulate
-        simulated_game = game.copy()
-        simulated_piece = Piece(state[0], state[1], self.game.current_piece.shape)
-        simulated_piece.rotation = state[2]
-        simulated_game.current_piece = simulated_piece
-
-        # Place the piece
-        while simulated_game.valid_space(simulated_piece):
-            simulated_piece.y += 1
-        simulated_piece.y -= 1  # Move back to the last valid position
-        simulated_game.push(simulated_piece.x, simulated_piece.y, simulated_piece.rotation)
-
-        # Run random rollouts
-        score = 0
-        simulation_depth = 20
-        for depth in range(simulation_depth):
-            possible_moves = self.get_possible_states(simulated_game)
-            if not possible_moves:
-                score -= 20000
-                break
-            x, y, rotation = random.choice(possible_moves)
-            if simulated_game.push(x, y, rotation):
-                score -= 20000
-                break
-            score += self.evaluate_state(simulated_game) + 4
-        while not simulated_game.history:
-            simulated_game.pop()
+            tuple: The chosen move, or None if the current piece cannot be placed.
 
-        return score
+        Raises:
+            SearchTimeout: If the search was cancelled.
+        """
+        snapshot = game.snapshot()
+        shares = [self.simulations // self.workers + (k < self.simulations % self.workers)
+                  for k in range(self.workers)]
+        tasks = [(snapshot, share, self.time_budget, self.randomizer.getrandbits(32))
+                 for share in shares]
+        self.get_pool(self.workers)
+        results = self.run_in_pool(search_tree, tasks)
+        moves = results[0][0]
+        if not moves:
+            return None
+        visits = np.sum([result[1] for result in results], axis=0)
+        value_sum = np.sum([result[2] for result in results], axis=0)
+        self.last_simulations = sum(result[3] for result in results)
+        means = value_sum / np.maximum(visits, 1)
+        best = np.lexsort((-np.arange(len(moves)), means, visits))[-1]
+        return tuple(moves[best])
 
-    def backpropagate(self, state, score):
+    def select(self, node):
         """
-        Updates the tree with the results of a simulation through backpropagation.
+        Selects the best child of a node based on the Upper Confidence Bound for Trees (UCT) value.
 
         Args:
-            state (tuple): The state to update.
-            score (float): The score obtained from the simulation.
+            node (int): The index of the node in `tree`.
+
+        Returns:
+            int: The index of the selected child.
         """
-        while state:
-            self.tree[state]["visits"] += 1
-            self.tree[state]["score"] += score
-            state = self.get_parent_state(state)
+        # Selection using UCT (Upper Confidence Bound for Trees)
+        children = self.tree.children(node)
+        children = children[:self.admitted_children(node)]
+        if len(children) == 1:
+            return children.start
+        return children.start + int(np.argmax(self.uct_value(children)))
 
-    def get_game_state_key(self, game):
+    def admitted_children(self, node):
         """
-        Generates a unique key representing the current game state.
+        Computes how many children of a node selection may choose from. The children
+        are sorted by prior, so these are the most promising ones, and more of them
+        are admitted as the node is visited more often.
 
         Args:
-            game (Game): The current game instance.
+            node (int): The index of the node in `tree`.
 
         Returns:
-            tuple: The key representing the current game state.
+            int: The number of admitted children.
         """
-        return game.current_piece.x, game.current_piece.y, game.current_piece.rotation
+        visits = int(self.tree.visits[node])
+        return max(1, int(self.widening_constant * (visits + 1) ** self.widening_exponent))
 
-    def get_possible_states_from_state(self,game, state):
+    def uct_value(self, children):
         """
-        Generates possible states from a given state.
+        Computes the Upper Confidence Bound for Trees (UCT) value of nodes, plus
+        a bias towards nodes with a better prior that fades as they are visited.
 
         Args:
-            game (Game): The current game instance.
-            state (tuple): The state from which to generate possible states.
+            children (range): The indices of the nodes in `tree`.
 
         Returns:
-            list: A list of possible states.
+            np.ndarray: The UCT value of every node, infinite for unexplored nodes.
+        """
+        visits = self.tree.visits[children.start:children.stop]
+        value_sum = self.tree.value_sum[children.start:children.stop]
+        prior = self.tree.prior[children.start:children.stop]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            uct = value_sum / visits + 2 * (2 * (visits ** 0.5) / (1 + visits))
+            uct += self.prior_weight * prior / (1 + visits)
+        return np.where(visits == 0, np.inf, uct)  # Favor unexplored states
+
+    def expand(self, game, node):
         """
-        # current_piece = self.create_piece_from_state(game, state)
-        return self.get_possible_states(game)
-        # for rotation in range(len(current_piece.shape[1])):
-        #     for x in range(-2, self.game.cols - 2):
-        #         piece_copy = Piece(x, 0, current_piece.shape,rotation)
-        #         if self.game.valid_space(piece_copy):
-        #             possible_states.append((x, piece_copy.y, rotation))
-        # return possible_states
+        Expands the tree by adding the placements of the current piece as children of a node.
 
-    def create_piece_from_state(self,game, state):
+        Every placement is scored like `evaluate_state` would, and the children are stored
+        from the best score to the worst, so progressive widening admits them in
+        that order. Placements that lose the game come last.
+
+        Args:
+            game (Engine): The game in the state of the node. It is left unchanged.
+            node (int): The index of the node in `tree`.
+        """
+        moves = self.get_possible_states(game)
+        if not moves:
+            self.tree.expand(node, moves)
+            return
+        scores = self.evaluate_placements(game, moves)
+        self.nodes_searched += len(moves)
+        order = np.argsort(-scores, kind='stable')
+        self.tree.expand(node, [moves[i] for i in order], scores[order] - scores[order[0]])
+
+    def evaluate_placements(self, game, moves):
+        """
+        Evaluates the game after each placement of the current piece, as `evaluate_state`
+        would after `push`, but for all placements at once on copies of the board.
+
+        Args:
+            game (Engine): The game to place the current piece in. It is left unchanged.
+            moves (list): The placements (x, y, rotation) of the current piece.
+
+        Returns:
+            np.ndarray: The evaluation after every placement, -20000 where it loses the game.
+        """
+        offsets, masks, _ = self.placement_tables
+        placements = np.array(moves, dtype=np.int64)
+        shape = self.shape_index[game.current_piece.shape[0]]
+        x, y, rotation = placements[:, 0], placements[:, 1], placements[:, 2]
+        rows = y[:, None] + offsets[shape, rotation, x + 2]
+        masks = masks[shape, rotation, x + 2]
+        used = masks != 0
+        overflow = (used & (rows < 0)).any(axis=1)
+        used &= rows >= 0
+
+        # lock the pieces on copies of the board and clear full rows
+        boards = np.tile(np.array(game.board, dtype=np.int64), (len(moves), 1))
+        placement = np.arange(len(moves))
+        for k in range(masks.shape[1]):
+            boards[placement[used[:, k]], rows[used[:, k], k]] |= masks[used[:, k], k]
+        full = boards == (1 << game.cols) - 1
+        cleared = full.sum(axis=1)
+        if cleared.any():
+            order = np.argsort(~full, axis=1, kind='stable')
+            boards = np.take_along_axis(boards, order, axis=1)
+            boards[np.arange(game.rows)[None, :] < cleared[:, None]] = 0
+
+        scores = self.evaluate_batch(boards, game.score + score_table[cleared])
+        return np.where(overflow | (boards[:, 0] != 0), -20000, scores)
+
+    def simulate(self, game: Engine):
         """
-        Creates a Piece object from a given state.
+        Simulates a random game of hard drops from the given state, see `Rollout`.
 
         Args:
-            game (Game): The current game instance.
-            state (tuple): The state representing the piece's position and rotation.
+            game (Engine): The game to play on. It is changed by the simulation.
 
         Returns:
-            tuple: The game instance and the created Piece object.
+            list: The reward of every random placement: its evaluation plus 4, or
+                -20000 for the placement that lost the game.
         """
-        x, y, rotation = state
-        piece = Piece(x, y, self.game.current_piece.shape)
-        piece.rotation = rotation
-        return game, piece
+        return self.rollout.play(game, self.simulation_depth, self.evaluate_state, self.randomizer)
 
-    def get_parent_state(self, state):
+    def backpropagate(self, node, depth, rewards):
         """
-        Determines the parent state for backpropagation.
+        Updates the nodes of a simulation through backpropagation, following the
+        parent links from the selected node up to the root.
+
+        Every node is credited with the rewards of the `simulation_depth` placements
+        that follow it, so all nodes are scored over the same horizon, however deep
+        the tree below them has grown, and the value of a node does not depend on
+        how the root was reached. This keeps the statistics valid when the subtree
+        is reused for the next move.
 
         Args:
-            state (tuple): The state for which to find the parent.
+            node (int): The index of the selected node.
+            depth (int): The depth of the selected node, 0 for the root.
+            rewards (list): The rewards of the placements after the root, see `simulate`.
+        """
+        # prefix[d] is the sum of the rewards of the first d placements
+        prefix = [0] + np.cumsum(rewards).tolist()
+        last = len(rewards)
+        tree = self.tree
+        while node >= 0:
+            tree.visits[node] += 1
+            tree.value_sum[node] += (prefix[min(depth + self.simulation_depth, last)]
+                                     - prefix[min(depth, last)])
+            node = int(tree.parent[node])
+            depth -= 1
+
+    def get_game_state_key(self, game):
+        """
+        Generates a key representing the current game state: the board, the current
+        piece and the preview. The position of the piece is left out, so a piece
+        that has already fallen a little still matches.
+
+        Args:
+            game (Engine): The current game instance.
 
         Returns:
-            tuple: The parent state or None if not applicable.
+            tuple: The key representing the current game state.
         """
-        # Implement based on your tree structure and state representation
-        return None
+        piece = game.current_piece
+        return (tuple(game.board), piece.shape[0],
+                tuple(next_piece.shape[0] for next_piece in game.next_pieces[:4]))
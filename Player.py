@@ -1,18 +1,10 @@
-import pygame
-
-from Game import Game
-import numpy as np
-
-from Piece import Piece
-
-
 class Player:
     """
     Represents a player in the Tetris game. Handles player actions such as moving, rotating, dropping pieces, and quitting the game.
 
     Attributes:
         name (str): The name of the player.
-        game (Game): The current game instance associated with the player.
+        game (Engine): The current game instance associated with the player.
         commands (dict): A dictionary mapping command strings to game methods.
         states_path_map (dict): A dictionary to store state paths, primarily for AI or advanced gameplay.
         command_queue (list): A queue of commands to be executed in the game.
@@ -23,7 +15,7 @@ class Player:
 
         Args:
             name (str): The name of the player.
-            game (Game): The game instance that the player is controlling.
+            game (Engine): The game instance that the player is controlling.
         """
         self.name = name
         self.game = game
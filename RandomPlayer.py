@@ -19,17 +19,18 @@ class RandomPlayer(AIPlayerBase):
         """
         super().__init__(name, game)
 
-    def generate_command(self):
+    def choose_move(self, game):
         """
-        Randomly selects a possible move from the available states and places the current piece accordingly.
+        Randomly selects a possible move from the available states.
 
-        Chooses a random state from the list of possible states and updates the player's choice.
-        Sets the flag for placing the piece and calls the method to place the piece in the game.
+        Args:
+            game (Engine): The game to choose a move in.
+
+        Returns:
+            tuple: A random placement (x, y, rotation) of the current piece.
         """
-        possible_states = self.get_possible_states(self.game)
-        self.choice = random.choice(possible_states)
-        self.placing_piece = True
-        self.place_current_piece(self.choice)
+        possible_states = self.get_possible_states(game)
+        return random.choice(possible_states)
 
     def update(self, update_time):
         """
@@ -0,0 +1,105 @@
+"""
+This module defines the Rollout class, a fast random playout for Monte Carlo
+search. Instead of searching every reachable placement, a rollout only plays
+hard drops: the piece falls straight down from above the stack, so where it
+lands follows from the column heights the Engine already keeps.
+
+Classes:
+    - Rollout: Plays random hard drops on an Engine.
+
+Functions:
+    - build_drop_table(cols): Precomputes the cells and bottom profile of every
+      hard drop.
+"""
+import random
+from functools import lru_cache
+
+import Piece
+from Engine import build_piece_masks
+
+
+@lru_cache(maxsize=None)
+def build_drop_table(cols):
+    """
+    Precomputes every hard drop of every shape.
+
+    Args:
+        cols (int): The number of columns in the game grid.
+
+    Returns:
+        dict: Maps each shape name to a list of (x, rotation, bottoms, cells)
+            tuples, one per rotation and x at which the piece fits between the
+            walls. `cells` holds the (column, row offset) of every cell and
+            `bottoms` the (column, row offset) of the lowest cell per column.
+    """
+    masks = build_piece_masks(cols)
+    table = {}
+    for name, rotations in Piece.shape_list:
+        drops = []
+        for rotation in range(len(rotations)):
+            for i, rows in enumerate(masks[(name, rotation)]):
+                if rows is None:
+                    continue
+                cells = tuple((column, dy) for dy, mask in rows
+                              for column in range(cols) if mask >> column & 1)
+                bottoms = {}
+                for column, dy in cells:
+                    bottoms[column] = max(bottoms.get(column, dy), dy)
+                drops.append((i - 2, rotation, tuple(bottoms.items()), cells))
+        table[name] = drops
+    return table
+
+
+class Rollout:
+    """
+    A class to play random hard drops on a game, for Monte Carlo simulations.
+
+    Every step picks one of the current piece's hard drops uniformly at random
+    and finds its landing row with a single pass over the piece's bottom
+    profile. The cells are locked with `Engine.update_piece`, which keeps the
+    column heights and holes up to date for the next drop and for
+    `AIPlayerBase.evaluate_state`. No undo records are written, so the game
+    should be restored from a snapshot afterwards.
+
+    Attributes:
+        drops (dict): The hard drops of every shape, see `build_drop_table`.
+    """
+
+    def __init__(self, cols=10):
+        """
+        Initializes a Rollout for a grid width.
+
+        Args:
+            cols (int): The number of columns in the game grid (default is 10).
+        """
+        self.drops = build_drop_table(cols)
+
+    def play(self, game, depth, evaluate, randomizer=random):
+        """
+        Plays random hard drops until `depth` pieces are placed or the game is lost.
+
+        Args:
+            game (Engine): The game to play on. It is changed by the rollout.
+            depth (int): The maximum number of pieces to place.
+            evaluate (callable): Scores the game after each placement, such as
+                `AIPlayerBase.evaluate_state`.
+            randomizer (random.Random): The random number generator picking the drops.
+
+        Returns:
+            list: The reward of every placement: its evaluation plus 4, or -20000
+                for the placement that lost the game.
+        """
+        rows = game.rows
+        heights = game.heights
+        rewards = []
+        for _ in range(depth):
+            _, _, bottoms, cells = randomizer.choice(self.drops[game.current_piece.shape[0]])
+            y = min(rows - 1 - heights[column] - dy for column, dy in bottoms)
+            if not game.next_pieces:
+                game.next_pieces.append(game.get_shape())
+            game.update_piece([(column, y + dy) for column, dy in cells])
+            if game.check_lost():
+                rewards.append(-20000)
+                break
+            rewards.append(evaluate(game) + 4)
+        return rewards
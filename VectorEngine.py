@@ -0,0 +1,205 @@
+"""
+This module defines the VectorEngine class, which steps many headless Tetris
+games in lockstep. The boards of all games are kept in one numpy array of row
+bitmasks, so that placing N pieces, clearing rows and scoring are a handful
+of vectorized operations instead of N separate Engine calls.
+
+Every game draws its pieces from its own random.Random(seed), in the same
+order as Game(seed), so results can be reproduced in the interactive game.
+Like the interactive game, the preview always holds 5 pieces: a new piece is
+generated each time one is placed.
+
+Classes:
+    - VectorEngine: N games stepped together.
+
+Functions:
+    - build_placement_tables(cols): Packs the piece masks into arrays indexed
+      by shape, rotation and x.
+"""
+import random
+
+import numpy as np
+
+import Piece
+from Engine import Engine, build_piece_masks
+
+# score for clearing 0, 1, 2, 3 or 4 rows with one piece
+score_table = np.array([0, 10, 25, 45, 70], dtype=np.int64)
+
+
+def build_placement_tables(cols):
+    """
+    Packs the row bitmasks of `build_piece_masks` into arrays.
+
+    Args:
+        cols (int): The number of columns in the game grid.
+
+    Returns:
+        tuple: `offsets` and `masks`, two (shapes, 4, cols + 5, 4) integer
+            arrays holding the row offset and bitmask of up to 4 piece rows
+            for every [shape index, rotation, x + 2], and `inside`, a boolean
+            array that is False where the piece sticks out of the side walls
+            or the rotation does not exist. Unused piece rows have a 0 mask.
+    """
+    table = build_piece_masks(cols)
+    shape = (len(Piece.shape_list), 4, cols + 5)
+    offsets = np.zeros(shape + (4,), dtype=np.int64)
+    masks = np.zeros(shape + (4,), dtype=np.int64)
+    inside = np.zeros(shape, dtype=bool)
+    for s, (name, rotations) in enumerate(Piece.shape_list):
+        for rotation in range(len(rotations)):
+            for i, rows in enumerate(table[(name, rotation)]):
+                if rows is None:
+                    continue
+                inside[s, rotation, i] = True
+                for k, (dy, mask) in enumerate(rows):
+                    offsets[s, rotation, i, k] = dy
+                    masks[s, rotation, i, k] = mask
+    return offsets, masks, inside
+
+
+class VectorEngine:
+    """
+    A class to step N Tetris games in lockstep.
+
+    Attributes:
+        seeds (list): The seed of every game.
+        cols (int): The number of columns in the game grid (default is 10).
+        rows (int): The number of rows in the game grid (default is 20).
+        full_row (int): The bitmask of a completely filled row.
+        boards (np.ndarray): An (N, rows) array of row bitmasks, as in `Engine.board`.
+        queues (np.ndarray): An (N, 6) array with the shape index (into
+            `Piece.shape_list`) of the current piece followed by the 5 next pieces.
+        randomizers (list): The piece generator of every game.
+        scores (np.ndarray): The score of every game.
+        pieces (np.ndarray): The number of pieces every game has placed.
+        done (np.ndarray): True for games that are lost or received an invalid placement.
+    """
+
+    def __init__(self, seeds):
+        """
+        Initializes the games, one per seed.
+
+        Args:
+            seeds (list): The seed of every game, as given to `Game(seed)`.
+        """
+        self.seeds = list(seeds)
+        self.cols = 10
+        self.rows = 20
+        self.full_row = (1 << self.cols) - 1
+        self.offsets, self.masks, self.inside = build_placement_tables(self.cols)
+        self.rotation_counts = np.array([len(shape[1]) for shape in Piece.shape_list])
+        self.reset()
+
+    def reset(self):
+        """
+        Restarts every game from its seed.
+        """
+        count = len(self.seeds)
+        self.boards = np.zeros((count, self.rows), dtype=np.int64)
+        self.randomizers = [random.Random(seed) for seed in self.seeds]
+        self.queues = np.array([[self.get_shape(i) for _ in range(6)] for i in range(count)],
+                               dtype=np.int64).reshape(count, 6)
+        self.scores = np.zeros(count, dtype=np.int64)
+        self.pieces = np.zeros(count, dtype=np.int64)
+        self.done = np.zeros(count, dtype=bool)
+
+    def get_shape(self, i):
+        """
+        Draws the next piece of a game, the same way `Engine.get_shape` does.
+
+        Args:
+            i (int): The index of the game.
+
+        Returns:
+            int: The index of the shape in `Piece.shape_list`.
+        """
+        return self.randomizers[i].randint(0, len(Piece.shapes) - 1)
+
+    def step(self, placements):
+        """
+        Places the current piece of every game, clears full rows and scores.
+
+        A placement that sticks out of the grid, overlaps the stack or uses a
+        rotation the shape does not have leaves that game's board untouched
+        and ends the game. Games that are already done ignore their placement.
+
+        Args:
+            placements (np.ndarray): An (N, 3) integer array of (x, y, rotation)
+                per game, as returned by `AIPlayerBase.get_possible_states`.
+
+        Returns:
+            tuple: The (N,) rewards, i.e. the score gained by each game, and the
+                (N,) terminal flags after the step.
+        """
+        placements = np.asarray(placements, dtype=np.int64).reshape(-1, 3)
+        x, y, rotation = placements[:, 0], placements[:, 1], placements[:, 2]
+        games = np.arange(len(self.seeds))
+        shapes = self.queues[:, 0]
+
+        # look the piece rows up, keeping the indices in range for the lookup
+        column = np.clip(x + 2, 0, self.cols + 4)
+        turn = np.clip(rotation, 0, 3)
+        active = ~self.done
+        placed = (active & (x + 2 == column) & (rotation == turn)
+                  & (rotation < self.rotation_counts[shapes])
+                  & self.inside[shapes, turn, column])
+        masks = self.masks[shapes, turn, column]
+        rows = y[:, None] + self.offsets[shapes, turn, column]
+        used = masks != 0
+
+        # collisions, with the same rules as Engine.collides
+        cells = self.boards[games[:, None], np.clip(rows, 0, self.rows - 1)]
+        blocked = used & ((rows >= self.rows) | ((rows > 0) & (cells & masks != 0)))
+        placed &= ~blocked.any(axis=1)
+        invalid = active & ~placed
+
+        # lock the pieces, remembering cells above the grid
+        used &= placed[:, None]
+        overflow = (used & (rows < 0)).any(axis=1)
+        used &= rows >= 0
+        for k in range(masks.shape[1]):
+            rows_k = rows[used[:, k], k]
+            self.boards[games[used[:, k]], rows_k] |= masks[used[:, k], k]
+
+        # clear full rows: stable-sort them to the top, then empty them
+        full = self.boards == self.full_row
+        cleared = full.sum(axis=1)
+        if cleared.any():
+            order = np.argsort(~full, axis=1, kind='stable')
+            self.boards = np.take_along_axis(self.boards, order, axis=1)
+            self.boards[np.arange(self.rows)[None, :] < cleared[:, None]] = 0
+        rewards = score_table[cleared]
+        self.scores += rewards
+        self.pieces += placed
+
+        # take the next piece and refill the preview
+        self.queues[placed, :-1] = self.queues[placed, 1:]
+        for i in np.flatnonzero(placed):
+            self.queues[i, -1] = self.get_shape(i)
+
+        lost = placed & ((self.boards[:, 0] != 0) | overflow)
+        self.done |= lost | invalid
+        return rewards, self.done.copy()
+
+    def get_game(self, i):
+        """
+        Builds a standalone Engine with the current state of one game, for
+        example to let an AI player pick its next placement.
+
+        Args:
+            i (int): The index of the game.
+
+        Returns:
+            Engine: A new Engine instance with the same board, pieces, score
+                and piece generator state as the game.
+        """
+        game = Engine(self.seeds[i])
+        game.board[:] = [int(row) for row in self.boards[i]]
+        game.update_features()
+        game.score = int(self.scores[i])
+        game.run = not self.done[i]
+        game.current_piece, *game.next_pieces = [Piece.Piece(5, 0, Piece.shape_list[shape])
+                                                 for shape in self.queues[i]]
+        game.randomizer.setstate(self.randomizers[i].getstate())
+        return game
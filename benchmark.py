@@ -0,0 +1,189 @@
+"""
+Benchmarks the AI players headless: every player plays the same seeded games
+on an Engine, with each chosen move placed instantly, until the game is lost
+or a piece limit is reached.
+
+For every player it reports the pieces placed per second of play (choosing
+the moves and placing them, as one game step each), the decision latency
+percentiles, the nodes searched per decision, the lines cleared and the game
+length. The results can be saved as JSON and compared against a saved
+baseline; the exit status is 1 when a player regressed.
+
+Usage:
+    python3 benchmark.py [--players greedy montecarlo random] [--seeds 0 1 2]
+                         [--max-pieces N] [--json results.json]
+                         [--baseline baseline.json] [--tolerance 0.2]
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+import numpy as np
+
+from BeamSearchPlayer import BeamSearchPlayer
+from Engine import Engine
+from GreedyDFSPlayer import GreedyDFSPlayer
+from MonteCarloPlayer import MonteCarloPlayer
+from RandomPlayer import RandomPlayer
+from VectorEngine import score_table
+
+# builds each player for a game and seed, with the settings of main.py where they are cheap enough
+players = {
+    'greedy': lambda game, seed: GreedyDFSPlayer('greedy', game, 0),
+    'montecarlo': lambda game, seed: MonteCarloPlayer('montecarlo', game, 100, seed=seed),
+    'random': lambda game, seed: RandomPlayer('random', game),
+    'beam': lambda game, seed: BeamSearchPlayer('beam', game, 6, 8),
+}
+
+# (metric, True if higher is better) compared against the baseline
+compared_metrics = [('pieces_per_sec', True), ('latency_p95_ms', False),
+                    ('lines_per_game', True), ('pieces_per_game', True)]
+
+
+def play_game(name, seed, max_pieces):
+    """
+    Plays one headless game with a player.
+
+    Args:
+        name (str): The player, a key of `players`.
+        seed (int): The seed of the game's piece sequence and of the player.
+        max_pieces (int): The number of pieces after which the game is stopped.
+
+    Returns:
+        dict: The seed, the pieces placed, the lines cleared, the score, the
+            latency of every decision in milliseconds, the nodes searched and the
+            seconds spent playing: choosing every move, including a last one that
+            found no placement, and placing the chosen pieces.
+    """
+    random.seed(seed)
+    game = Engine(seed)
+    player = players[name](game, seed)
+    latencies = []
+    nodes = 0
+    pieces = 0
+    lines = 0
+    elapsed = 0
+    try:
+        while pieces < max_pieces:
+            start = time.perf_counter()
+            move = player.choose_move(game)
+            decided = time.perf_counter()
+            latencies.append((decided - start) * 1000)
+            nodes += getattr(player, 'nodes_searched', 0)
+            if move is None:
+                elapsed += decided - start
+                break
+            score = game.score
+            lost = game.push(*move)
+            if not lost:
+                # the live game draws a new preview piece when a piece locks
+                game.next_pieces.append(game.get_shape())
+            elapsed += time.perf_counter() - start
+            pieces += 1
+            lines += int(np.flatnonzero(score_table == game.score - score)[0])
+            if lost:
+                break
+    finally:
+        player.close()
+    return {'seed': seed, 'pieces': pieces, 'lines': lines, 'score': game.score,
+            'latencies': latencies, 'nodes': nodes, 'elapsed': elapsed}
+
+
+def summarize(games):
+    """
+    Aggregates the games of one player.
+
+    Args:
+        games (list): The results of `play_game`.
+
+    Returns:
+        dict: The metrics of the player, along with the pieces, lines and score
+            of every game.
+    """
+    latencies = np.concatenate([game['latencies'] for game in games])
+    pieces = sum(game['pieces'] for game in games)
+    return {
+        'pieces_per_sec': pieces / sum(game['elapsed'] for game in games),
+        'latency_p50_ms': float(np.percentile(latencies, 50)),
+        'latency_p95_ms': float(np.percentile(latencies, 95)),
+        'latency_p99_ms': float(np.percentile(latencies, 99)),
+        'nodes_per_decision': sum(game['nodes'] for game in games) / len(latencies),
+        'lines_per_game': sum(game['lines'] for game in games) / len(games),
+        'pieces_per_game': pieces / len(games),
+        'games': [{key: game[key] for key in ('seed', 'pieces', 'lines', 'score')}
+                  for game in games],
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compares results against a baseline.
+
+    Args:
+        results (dict): The metrics of every player, see `summarize`.
+        baseline (dict): Results saved by an earlier run.
+        tolerance (float): The relative change allowed before a metric counts as a regression.
+
+    Returns:
+        list: A description of every regression.
+    """
+    regressions = []
+    for name, metrics in results.items():
+        if name not in baseline:
+            continue
+        for metric, higher_is_better in compared_metrics:
+            old, new = baseline[name][metric], metrics[metric]
+            if higher_is_better:
+                regressed = new < old * (1 - tolerance)
+            else:
+                regressed = new > old * (1 + tolerance)
+            if regressed:
+                regressions.append(f"{name} {metric}: {old:.2f} -> {new:.2f}")
+    return regressions
+
+
+def main():
+    """
+    Runs the benchmark, prints a table of the results, saves them and compares
+    them against a baseline if asked to.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--players', nargs='+', choices=list(players),
+                        default=['greedy', 'montecarlo', 'random'], help='players to benchmark')
+    parser.add_argument('--seeds', nargs='+', type=int, default=[0, 1, 2],
+                        help='seeds of the games every player plays')
+    parser.add_argument('--max-pieces', type=int, default=200,
+                        help='number of pieces after which a game is stopped')
+    parser.add_argument('--json', help='file to save the results to')
+    parser.add_argument('--baseline', help='results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='relative change allowed before a metric counts as a regression')
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'player':<12}{'pieces/s':>10}{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}"
+          f"{'nodes':>10}{'lines':>8}{'pieces':>8}")
+    for name in args.players:
+        metrics = results[name] = summarize([play_game(name, seed, args.max_pieces)
+                                             for seed in args.seeds])
+        print(f"{name:<12}{metrics['pieces_per_sec']:>10.1f}{metrics['latency_p50_ms']:>10.2f}"
+              f"{metrics['latency_p95_ms']:>10.2f}{metrics['latency_p99_ms']:>10.2f}"
+              f"{metrics['nodes_per_decision']:>10.1f}{metrics['lines_per_game']:>8.1f}"
+              f"{metrics['pieces_per_game']:>8.1f}")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
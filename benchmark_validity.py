@@ -0,0 +1,100 @@
+"""
+Benchmarks AIPlayerBase.get_position_validity against the per-lattice-point
+reference it replaced, on an empty, a mid-game and a near-death board.
+
+For every board and every shape the two arrays are checked to be identical
+before they are timed.
+
+Usage:
+    python3 benchmark_validity.py [--repeat N]
+"""
+import argparse
+import random
+import timeit
+
+import numpy as np
+
+import Piece
+from AIPlayerBase import AIPlayerBase
+from Engine import Engine
+
+
+def reference_position_validity(game, piece):
+    """
+    Computes the validity array by calling `valid_space` on every lattice point.
+
+    Args:
+        game (Engine): The game instance.
+        piece (Piece): The piece to check. It is moved around the lattice.
+
+    Returns:
+        np.ndarray: The validity array, indexed by [x, y, rotation].
+    """
+    orientation = len(piece.shape[1])
+    validity = np.zeros(
+        (game.cols + 5, game.rows + 5, orientation),
+        dtype=bool)
+    for piece.x in range(-2, game.cols + 3):
+        for piece.y in range(0, game.rows + 5):
+            for piece.rotation in range(orientation):
+                if game.valid_space(piece):
+                    validity[piece.x, piece.y, piece.rotation] = True
+    return validity
+
+
+def make_board(stack_height, seed):
+    """
+    Creates a game whose columns are filled up to about `stack_height` rows,
+    with a few holes and no full rows.
+
+    Args:
+        stack_height (int): The approximate height of the stack.
+        seed (int): The seed used to shape the stack.
+
+    Returns:
+        Engine: The game instance.
+    """
+    rng = random.Random(seed)
+    game = Engine(seed)
+    for x in range(game.cols):
+        height = max(0, min(game.rows - 1, stack_height + rng.randint(-2, 2)))
+        for y in range(game.rows - height, game.rows):
+            if rng.random() < 0.9:
+                game.board[y] |= 1 << x
+    for y in range(game.rows):
+        if game.board[y] == game.full_row:
+            game.board[y] &= ~(1 << rng.randrange(game.cols))
+    game.update_features()
+    return game
+
+
+def main():
+    """
+    Runs the benchmark and prints the time per call of both implementations.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='number of calls timed per board and shape')
+    args = parser.parse_args()
+
+    player = AIPlayerBase('benchmark', Engine(0))
+    boards = {'empty': make_board(0, 1), 'mid-game': make_board(8, 2),
+              'near-death': make_board(17, 3)}
+    print(f"{'board':<12}{'reference (ms)':>16}{'vectorized (ms)':>17}{'speedup':>10}")
+    for name, game in boards.items():
+        reference = vectorized = 0
+        for shape in Piece.shape_list:
+            piece = Piece.Piece(5, 0, shape)
+            assert np.array_equal(reference_position_validity(game, piece.copy()),
+                                  player.get_position_validity(game, piece.copy()))
+            reference += timeit.timeit(lambda: reference_position_validity(game, piece.copy()),
+                                       number=args.repeat)
+            vectorized += timeit.timeit(lambda: player.get_position_validity(game, piece.copy()),
+                                        number=args.repeat)
+        calls = args.repeat * len(Piece.shape_list)
+        print(f"{name:<12}{reference / calls * 1000:>16.3f}{vectorized / calls * 1000:>17.3f}"
+              f"{reference / vectorized:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
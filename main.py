@@ -8,6 +8,7 @@ from MonteCarloPlayer import MonteCarloPlayer
 from RandomPlayer import RandomPlayer
 from Player import Player
 from GreedyDFSPlayer import GreedyDFSPlayer
+from BeamSearchPlayer import BeamSearchPlayer
 """
 10 x 20 square grid
 shapes: S, Z, I, O, J, L, T
@@ -51,11 +52,17 @@ def main(difficulty):
         game2.player = GreedyDFSPlayer("Advanced", game2, 1)
         game2.player.command_interval = 150
     elif difficulty == 2:
-        game2.player = GreedyDFSPlayer("Nightmare", game2, 1)
+        game2.player = GreedyDFSPlayer("Nightmare", game2, 1, prune=True)
         game2.player.command_interval = 100
-    else:
-        game2.player = MonteCarloPlayer("MCST", game2, 50)
+        game2.player.pipeline = True
+    elif difficulty == 3:
+        game2.player = MonteCarloPlayer("MCST", game2, 500)
         game2.player.command_interval = 150
+        game2.player.pipeline = True
+    else:
+        game2.player = BeamSearchPlayer("Beam Search", game2, 6, 8)
+        game2.player.command_interval = 100
+        game2.player.pipeline = True
 
     rect = pygame.Rect(0, 0, G.s_width, G.s_height)
     game1_surface = pygame.Surface(rect.size)
@@ -78,6 +85,7 @@ def main(difficulty):
         win.blit(game2_surface, (left_margin * 2 + G.s_width, top_margin))
         pygame.display.flip()
 
+    game2.player.close()
     pygame.display.update()
     pygame.time.delay(2000)
 
@@ -91,6 +99,7 @@ def main_menu():
         1 - Advanced
         2 - Nightmare
         3 - Monte Carlo
+        4 - Beam Search
 
     The player can navigate the menu using the up and down arrow keys, 
     and select a difficulty by pressing the Enter key.
@@ -99,11 +108,11 @@ def main_menu():
     """
     run = True
     selected_diff = 0
-    difficulty_text = ["Easy", "Advanced", "Nightmare", "Monte Carlo"]
+    difficulty_text = ["Easy", "Advanced", "Nightmare", "Monte Carlo", "Beam Search"]
     while run:
         win.fill((0, 0, 0))
 
-        for i in range(4):
+        for i in range(len(difficulty_text)):
             G.draw_text(difficulty_text[i], 60, (255, 255, 255), win,
                         G.s_width + left_margin - 200,
                         G.s_height / 2 - 100 + i * 80)
@@ -119,9 +128,9 @@ def main_menu():
                 run = False
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_UP:
-                    selected_diff = (selected_diff - 1) % 4
+                    selected_diff = (selected_diff - 1) % len(difficulty_text)
                 elif event.key == pygame.K_DOWN:
-                    selected_diff = (selected_diff + 1) % 4
+                    selected_diff = (selected_diff + 1) % len(difficulty_text)
                 elif event.key == pygame.K_RETURN:
                     win.fill((0, 0, 0))
                     main(selected_diff)
@@ -0,0 +1,195 @@
+"""
+Micro-benchmarks the engine and AI hot paths on a library of canned boards:
+an empty board, a jagged stack, a stack full of overhangs and a stack that
+nearly reaches the top.
+
+Every entry is called on a Game, the way the interactive game calls it, and
+reports the median time per call along with the memory a call allocates,
+measured with tracemalloc: the peak of the bytes allocated during the call and
+the number of memory blocks still held after it. The results can be saved as
+JSON and an earlier run given as a baseline, to print the speedup of every entry.
+
+Usage:
+    python3 microbenchmark.py [--repeat N] [--json results.json]
+                              [--baseline baseline.json]
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+import numpy as np
+
+import Piece
+from AIPlayerBase import AIPlayerBase
+from Game import Game
+from benchmark_validity import make_board
+
+
+def make_game(board, seed=0):
+    """
+    Creates a Game holding a board, with a T piece at the top as the current piece.
+
+    Args:
+        board (list): One row bitmask per row, see `Engine.board`.
+        seed (int): The seed of the game.
+
+    Returns:
+        Game: The game instance.
+    """
+    game = Game(seed)
+    game.board[:] = board
+    game.update_features()
+    game.locked_positions = {(x, y): (128, 128, 128) for y, row in enumerate(board)
+                             for x in range(game.cols) if row >> x & 1}
+    game.current_piece = Piece.Piece(5, 0, ('T', Piece.shapes['T']))
+    return game
+
+
+def make_boards():
+    """
+    Builds the canned boards. None of them has a full row.
+
+    Returns:
+        dict: Maps every board name to a Game.
+    """
+    cols, rows = 10, 20
+    jagged = [0, 9, 2, 12, 1, 8, 3, 11, 0, 6]
+    overhang = [0] * rows
+    for x in range(cols):
+        # columns of height 10 with every other cell under the top one empty
+        for y in range(rows - 10, rows):
+            if y == rows - 10 or (x + y) % 2:
+                overhang[y] |= 1 << x
+    for y in range(rows):
+        if overhang[y] == (1 << cols) - 1:
+            overhang[y] &= ~1
+    return {
+        'empty': make_game([0] * rows),
+        'jagged': make_game([sum(1 << x for x in range(cols) if rows - y <= jagged[x])
+                             for y in range(rows)]),
+        'overhang': make_game(overhang),
+        'near-top': make_game(make_board(17, 3).board),
+    }
+
+
+def make_entries(game, player):
+    """
+    Lists the benchmarked calls on one board.
+
+    Args:
+        game (Game): The board to run the calls on.
+        player (AIPlayerBase): The player to run the AI calls with. It plays `game`.
+
+    Returns:
+        list: (name, call, reset) tuples. `call` is timed; `reset`, if not None,
+            restores the state `call` changes and runs before every call.
+    """
+    snapshot = game.snapshot()
+    piece = game.current_piece
+    moves = player.get_possible_states(game)
+    move = moves[len(moves) // 2]
+    # a game that is not the player's live game is searched on every call
+    searched = game.clone()
+
+    def fill_rows():
+        game.restore(snapshot)
+        for y in (game.rows - 1, game.rows - 3):
+            game.board[y] = game.full_row
+        game.update_features()
+
+    def push_pop():
+        game.push(*move)
+        game.pop()
+
+    return [
+        ('valid_space', lambda: game.valid_space(piece), None),
+        ('convert_shape_format', lambda: game.convert_shape_format(piece), None),
+        ('update_valid_positions', game.update_valid_positions, None),
+        ('clear_rows', game.clear_rows, fill_rows),
+        ('copy', game.copy, None),
+        ('push/pop', push_pop, None),
+        ('get_position_validity', lambda: player.get_position_validity(game, piece.copy()), None),
+        ('get_possible_states', lambda: player.get_possible_states(searched), None),
+        ('place_current_piece', lambda: player.place_current_piece(move), None),
+        ('evaluate_state', lambda: player.evaluate_state(game), None),
+    ]
+
+
+def measure(call, reset, repeat):
+    """
+    Times a call and measures its allocations.
+
+    Args:
+        call (callable): The benchmarked call.
+        reset (callable): Runs before every call, untimed, or None.
+        repeat (int): The number of timed calls.
+
+    Returns:
+        dict: The median time per call in microseconds, and the peak bytes
+            allocated and the blocks retained by one call, its result included.
+    """
+    times = []
+    for _ in range(repeat):
+        if reset is not None:
+            reset()
+        start = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - start)
+
+    if reset is not None:
+        reset()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    current, _ = tracemalloc.get_traced_memory()
+    result = call()
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    del result
+    # leave out the bookkeeping of tracemalloc and of this benchmark
+    ignored = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+    blocks = sum(stat.count_diff for stat in after.filter_traces(ignored).compare_to(
+        before.filter_traces(ignored), 'lineno'))
+    return {'time_us': float(np.median(times)) * 1e6, 'peak_bytes': peak - current,
+            'blocks': blocks}
+
+
+def main():
+    """
+    Runs the micro-benchmarks and prints a table of the results.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=200,
+                        help='number of timed calls per entry and board')
+    parser.add_argument('--json', help='file to save the results to')
+    parser.add_argument('--baseline', help='results of an earlier run to compare against')
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    results = {}
+    print(f"{'entry':<24}{'board':<10}{'time (us)':>12}{'peak (B)':>10}{'blocks':>8}"
+          f"{'speedup':>9}")
+    for board, game in make_boards().items():
+        player = AIPlayerBase('benchmark', game)
+        for name, call, reset in make_entries(game, player):
+            key = f"{name} {board}"
+            result = results[key] = measure(call, reset, args.repeat)
+            speedup = ''
+            if key in baseline:
+                speedup = f"{baseline[key]['time_us'] / result['time_us']:.2f}x"
+            print(f"{name:<24}{board:<10}{result['time_us']:>12.2f}{result['peak_bytes']:>10}"
+                  f"{result['blocks']:>8}{speedup:>9}")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()